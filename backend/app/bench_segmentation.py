@@ -0,0 +1,56 @@
+import collections
+import time
+
+from backend.app import lookups, segmenter
+from backend.app.database import SessionLocal
+from backend.app.load_data import SENTENCES_FILE
+
+# Compare the segmentation engines on the example sentences
+# Throughput is measured in characters per second and agreement is the token F1
+# score against jieba's precise mode, which is used as the reference.
+# Usage: python -m backend.app.bench_segmentation
+
+
+def _count_matches(words: list[str], reference: list[str]) -> tuple[int, int, int]:
+    """Count matching, produced and reference tokens"""
+    matching = sum((collections.Counter(words) & collections.Counter(reference)).values())
+    return matching, len(words), len(reference)
+
+
+def benchmark(sentences: list[str], engines: list[segmenter.SegmentationEngine]):
+    characters = sum(len(sentence) for sentence in sentences)
+    reference = [list(segmenter.ENGINES["jieba"].cut(sentence)) for sentence in sentences]
+
+    for engine in engines:
+        start = time.perf_counter()
+        results = [list(engine.cut(sentence)) for sentence in sentences]
+        elapsed = time.perf_counter() - start
+
+        matching = produced = expected = 0
+        for words, reference_words in zip(results, reference):
+            m, p, e = _count_matches(words, reference_words)
+            matching, produced, expected = matching + m, produced + p, expected + e
+
+        precision = matching / produced if produced else 0
+        recall = matching / expected if expected else 0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0
+
+        print(
+            f"{engine.name:>10}: {characters / elapsed:>12,.0f} chars/s  "
+            f"precision {precision:.3f}  recall {recall:.3f}  F1 {f1:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    with open(SENTENCES_FILE, "rt") as file:
+        sentences = [line.strip() for line in file]
+
+    segmenter.initialize()
+    with SessionLocal() as db:
+        engines = [
+            segmenter.ENGINES["jieba"],
+            segmenter.ENGINES["jieba-full"],
+            lookups.get_trie_engine(db),
+        ]
+
+    benchmark(sentences, engines)
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Use redis to cache HSK lists
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+if os.getenv("REDIS_HOST") == "redis":  # If using Docker
+    redis_url = "redis://redis:6379"
+
+r = redis.from_url(redis_url)
+
+# don't keep retrying redis on every request if it goes away
+REDIS_RETRY_AFTER = 30  # seconds
+
+# larger values are only kept in the local tier since they aren't worth the bandwidth
+REDIS_MAX_VALUE_SIZE = 1024 * 1024
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so that trivially different copies share a cache entry"""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def content_key(text: str, *parts: str) -> str:
+    """Create a key from the hash of the text and anything that affects the result"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(text.encode())
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU cache of serialized values with a total size limit"""
+
+    def __init__(self, max_bytes: int, ttl: int | None = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._data = OrderedDict()  # key -> (value, expiry time)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.size -= len(value)
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return  # would evict everything else
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            old_item = self._data.pop(key, None)
+            if old_item is not None:
+                self.size -= len(old_item[0])
+
+            self._data[key] = (value, expires)
+            self.size += len(value)
+
+            # evict the least recently used values until it fits again
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """In-process LRU cache backed by redis, which is shared between workers"""
+
+    def __init__(
+        self,
+        namespace: str,
+        max_bytes: int,
+        ttl: int,
+        local_ttl: int | None = None,
+        client=r,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUCache(max_bytes, ttl=local_ttl)
+        self.client = client
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()  # updated from threadpool workers
+        self._redis_down_until = 0
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis_available(self) -> bool:
+        return self.client is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception):
+        logger.warning("Redis is unavailable for the %s cache: %s", self.namespace, e)
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+    def get(self, key: str):
+        """Get a cached value, or None if it isn't cached"""
+        value = self.local.get(key)
+
+        if value is None and self._redis_available():
+            try:
+                value = self.client.get(self._redis_key(key))
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+            if value is not None:
+                self.local.set(key, value)  # promote to the local tier
+
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key: str, obj):
+        value = pickle.dumps(obj)
+        self.local.set(key, value)
+
+        if self._redis_available() and len(value) <= REDIS_MAX_VALUE_SIZE:
+            try:
+                self.client.setex(self._redis_key(key), self.ttl, value)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "entries": len(self.local),
+            "bytes": self.local.size,
+        }
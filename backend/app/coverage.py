@@ -0,0 +1,73 @@
+import numpy as np
+
+# Vocabulary coverage of a text by HSK level and by word list
+# Counts are grouped with bincount over level ids instead of looping over every word.
+
+MAX_LEVEL = 6
+
+# share of tokens that a reader should know to read a text comfortably
+READABILITY_THRESHOLD = 0.95
+
+
+def _ratio(part, total):
+    return float(part / total) if total else 0.0
+
+
+def compute_coverage(word_counts: dict[str, int], hsk_lookup, word_lists: list[dict] = ()) -> dict:
+    """Compute token and type coverage for HSK levels and word lists.
+
+    word_lists is a list of {"id", "name", "words"} where words is a set of words.
+    """
+    words = list(word_counts)
+    counts = np.fromiter(word_counts.values(), dtype=np.int64, count=len(words))
+    # level 0 stands for words that aren't in any HSK list
+    levels = np.fromiter(
+        (hsk_lookup.get(word) or 0 for word in words), dtype=np.int64, count=len(words)
+    )
+
+    total_tokens = int(counts.sum())
+    total_types = len(words)
+
+    tokens_by_level = np.bincount(levels, weights=counts, minlength=MAX_LEVEL + 1)
+    types_by_level = np.bincount(levels, minlength=MAX_LEVEL + 1)
+
+    # cumulative coverage i.e. HSK 3 includes the words from HSK 1 and 2
+    cumulative_tokens = np.cumsum(tokens_by_level[1:])
+    cumulative_types = np.cumsum(types_by_level[1:])
+
+    hsk = [
+        {
+            "level": level,
+            "tokens": int(tokens_by_level[level]),
+            "types": int(types_by_level[level]),
+            "token_coverage": _ratio(cumulative_tokens[level - 1], total_tokens),
+            "type_coverage": _ratio(cumulative_types[level - 1], total_types),
+        }
+        for level in range(1, MAX_LEVEL + 1)
+    ]
+
+    # the lowest level that covers enough of the text (None if even HSK 6 doesn't)
+    readable = np.flatnonzero(cumulative_tokens >= READABILITY_THRESHOLD * total_tokens)
+    readability_level = int(readable[0]) + 1 if total_tokens and readable.size else None
+
+    word_array = np.array(words, dtype=str)
+    word_list_coverage = []
+    for word_list in word_lists:
+        known = np.isin(word_array, list(word_list["words"]))
+        word_list_coverage.append(
+            {
+                "id": word_list["id"],
+                "name": word_list["name"],
+                "token_coverage": _ratio(counts[known].sum(), total_tokens),
+                "type_coverage": _ratio(known.sum(), total_types),
+            }
+        )
+
+    return {
+        "tokens": total_tokens,
+        "types": total_types,
+        "hsk": hsk,
+        "non_hsk": {"tokens": int(tokens_by_level[0]), "types": int(types_by_level[0])},
+        "readability_level": readability_level,
+        "word_lists": word_list_coverage,
+    }
@@ -1,9 +1,25 @@
 from datetime import datetime
+from typing import Literal
 
-from sqlalchemy.orm import Session
+import numpy as np
+from sqlalchemy import and_, false, func, literal, not_, or_, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
 
+import backend.app.lookups as lookups
 import backend.app.models as models
-from backend.app.helpers import is_chinese_script, hash_password, parse_pinyin
+import backend.app.normalization as normalization
+import backend.app.planner as planner
+import backend.app.postings as postings
+import backend.app.search as search
+from backend.app.helpers import (
+    PINYIN_TONES,
+    is_chinese_script,
+    hash_password,
+    normalize_pinyin,
+    parse_pinyin,
+    strip_tones,
+)
 
 
 def create_user(db: Session, username: str, password: str):
@@ -16,18 +32,79 @@ def create_user(db: Session, username: str, password: str):
     return user
 
 
-def get_sentences(db: Session, limit: int = 100, offset: int = 0, keyword: str = None):
-    """Get all sentences in accordance to limit and offset"""
+SentenceSort = Literal["id", "difficulty"]
+
+# columns that each sort orders by (and that a cursor continues after)
+SENTENCE_SORT_COLUMNS = {
+    "id": (models.Sentence.id,),
+    "difficulty": (models.Sentence.difficulty, models.Sentence.id),
+}
+
+
+def get_sentences(
+    db: Session,
+    limit: int = 100,
+    offset: int = 0,
+    keyword: str = None,
+    after: dict = None,
+    max_level: int = None,
+    max_unknown_ratio: float = None,
+    sort: SentenceSort = None,
+):
+    """Get all sentences in accordance to limit and offset
+
+    Keyword matches are sorted by relevance unless a sort is given.
+    If after is given (the sort keys of the last sentence, empty for the first page),
+    the sentences after it are returned instead of using the offset, with one extra
+    row to tell whether there is a next page. Without a sort, they are in id order.
+    """
+    query = db.query(models.Sentence)
+
+    # range scans over the indexed metrics
+    if max_level is not None:
+        query = query.filter(models.Sentence.max_hsk_level <= max_level)
+    if max_unknown_ratio is not None:
+        query = query.filter(models.Sentence.unknown_ratio <= max_unknown_ratio)
+    if sort == "difficulty":
+        query = query.filter(models.Sentence.difficulty.is_not(None))
+
+    order_by = SENTENCE_SORT_COLUMNS[sort or "id"]
+
     if keyword:  # search by query if it exists
-        return (
-            db.query(models.Sentence)
-            .filter(models.Sentence.text.contains(keyword))
-            .limit(limit)
-            .offset(offset)
-            .all()
-        )
+        # simplified and traditional keywords find the same sentences
+        keyword = normalization.normalize_script(keyword, lookups.get_script_table(db))
+
+        matched = search.match_sentences(db, query, keyword)
+        if matched is not None:
+            query, relevance = matched
+        else:
+            # keywords that are too short for the full-text index, shorter sentences first
+            query = query.filter(
+                models.Sentence.text_normalized.contains(keyword, autoescape=True)
+            )
+            relevance = (func.length(models.Sentence.text), models.Sentence.id)
+
+        # a page can't continue after a relevance score
+        if sort is None and after is None:
+            order_by = relevance
+
+    if after is not None:
+        if after:
+            values = [after[column.key] for column in order_by]
+            query = query.filter(tuple_(*order_by) > tuple_(*values))
+        return query.order_by(*order_by).limit(limit + 1).all()
+
+    return query.order_by(*order_by).offset(offset).limit(limit).all()
 
-    return db.query(models.Sentence).offset(offset).limit(limit).all()
+
+def sentence_cursor_keys(sort: SentenceSort = None) -> tuple[str, ...]:
+    """Get the keys stored in a cursor for the sort"""
+    return tuple(column.key for column in SENTENCE_SORT_COLUMNS[sort or "id"])
+
+
+def keyset_page(query, id_column, after_id: int, limit: int):
+    """Get up to limit + 1 rows after after_id, in id order"""
+    return query.filter(id_column > after_id).order_by(id_column).limit(limit + 1).all()
 
 
 def get_sentence(db: Session, sentence_id: int):
@@ -35,6 +112,129 @@ def get_sentence(db: Session, sentence_id: int):
     return db.query(models.Sentence).filter(models.Sentence.id == sentence_id).first()
 
 
+def get_sentence_with_translation(db: Session, sentence_id: int, target_lang: str):
+    """Get a sentence and its stored translation (None if it hasn't been translated)"""
+    row = (
+        db.query(models.Sentence, models.SentenceTranslation.text)
+        .outerjoin(
+            models.SentenceTranslation,
+            (models.SentenceTranslation.sentence_id == models.Sentence.id)
+            & (models.SentenceTranslation.target_lang == target_lang),
+        )
+        .filter(models.Sentence.id == sentence_id)
+        .first()
+    )
+    return tuple(row) if row else (None, None)
+
+
+def get_untranslated_sentences(
+    db: Session,
+    target_lang: str,
+    limit: int,
+    after_id: int = 0,
+    sentence_ids: list[int] = None,
+) -> list[tuple[int, str]]:
+    """Get the ids and texts of sentences without a stored translation, in id order"""
+    query = (
+        db.query(models.Sentence.id, models.Sentence.text)
+        .outerjoin(
+            models.SentenceTranslation,
+            (models.SentenceTranslation.sentence_id == models.Sentence.id)
+            & (models.SentenceTranslation.target_lang == target_lang),
+        )
+        .filter(models.SentenceTranslation.sentence_id.is_(None))
+        .filter(models.Sentence.id > after_id)
+    )
+    if sentence_ids is not None:
+        query = query.filter(models.Sentence.id.in_(sentence_ids))
+    return [tuple(row) for row in query.order_by(models.Sentence.id).limit(limit).all()]
+
+
+def save_sentence_translations(db: Session, target_lang: str, translations: dict[int, str]):
+    """Store translations (sentence id -> text), skipping ones that already exist"""
+    existing = {
+        sentence_id
+        for sentence_id, in db.query(models.SentenceTranslation.sentence_id).filter(
+            models.SentenceTranslation.target_lang == target_lang,
+            models.SentenceTranslation.sentence_id.in_(list(translations)),
+        )
+    }
+    db.add_all(
+        models.SentenceTranslation(sentence_id=sentence_id, target_lang=target_lang, text=text)
+        for sentence_id, text in translations.items()
+        if sentence_id not in existing
+    )
+    try:
+        db.commit()
+    except IntegrityError:
+        # some were stored by someone else in the meantime, so go one by one
+        db.rollback()
+        for sentence_id, text in translations.items():
+            db.merge(
+                models.SentenceTranslation(
+                    sentence_id=sentence_id, target_lang=target_lang, text=text
+                )
+            )
+        db.commit()
+
+
+ExampleSort = Literal["length", "difficulty"]
+
+
+def get_example_sentences(
+    db: Session, words: list[str], limit: int = 20, offset: int = 0, sort: ExampleSort = "length"
+):
+    """Get the sentences that contain any of the words, shortest (or easiest) first"""
+    sentence_ids = postings.get_sentence_ids(db, [word for word in words if word])
+
+    # sentences added after the keys were built are sorted last
+    sort_keys = lookups.get_sentence_sort_keys(db, sort)
+    known = sentence_ids < len(sort_keys)
+    keys = np.where(known, sort_keys[np.where(known, sentence_ids, 0)], np.inf)
+
+    # only the sentences on the requested page are loaded
+    order = np.lexsort((sentence_ids, keys))[offset:offset + limit]
+    page_ids = sentence_ids[order].tolist()
+
+    sentences = db.query(models.Sentence).filter(models.Sentence.id.in_(page_ids)).all()
+    sentences_by_id = {sentence.id: sentence for sentence in sentences}
+    return [sentences_by_id[i] for i in page_ids if i in sentences_by_id]
+
+
+def get_entry(db: Session, entry_id: int):
+    """Get a dictionary entry based on its ID"""
+    return db.query(models.Entry).filter(models.Entry.id == entry_id).first()
+
+
+def get_entry_suggestions(db: Session, entry_ids: list[int]) -> list[dict]:
+    """Get the words and pinyin of entries, in the order of the ids"""
+    rows = (
+        db.query(
+            models.Entry.id,
+            models.Entry.simplified,
+            models.Entry.traditional,
+            models.Entry.pinyin_toned,
+        )
+        .filter(models.Entry.id.in_(entry_ids))
+        .all()
+    )
+    suggestions = {
+        entry_id: {
+            "id": entry_id,
+            "simplified": simplified,
+            "traditional": traditional,
+            "pinyin": pinyin,
+        }
+        for entry_id, simplified, traditional, pinyin in rows
+    }
+    return [suggestions[i] for i in entry_ids if i in suggestions]
+
+
+def get_hsk_word(db: Session, word_id: int):
+    """Get an HSK word based on its ID"""
+    return db.query(models.Word).filter(models.Word.id == word_id).first()
+
+
 def get_hsk_words(db: Session):
     """Get all HSK words"""
     return db.query(models.Word).all()
@@ -45,65 +245,265 @@ def get_hsk_words_by_level(db: Session, level: int):
     return db.query(models.Word).filter(models.Word.level_id == level).all()
 
 
-def get_dictionary_entries(db: Session, limit: int = 20, keyword: str = None):
-    """Get all dictionary entries"""
+def prefix_range(column, prefix: str):
+    """Match values starting with prefix as a range, which can use the column's index"""
+    return and_(column >= prefix, column < prefix + "\uffff")
+
+
+def match_pinyin(query, keyword: str):
+    """Restrict a query of entries to the ones whose pinyin starts with the keyword
+
+    ji1lei3, jilei and ji lei all match 积累 (ji1 lei3), and a syllable without a
+    tone matches any tone, e.g., "hao" also matches "hao3".
+    Also returns the condition for the pinyin matching the keyword exactly.
+    """
+    syllables = [normalize_pinyin(syllable) for syllable in parse_pinyin(keyword)]
+    if not syllables:
+        return query.filter(false()), None
+
+    toned = [syllable[-1] in PINYIN_TONES for syllable in syllables]
+    if all(toned):
+        pinyin = " ".join(syllables)
+        query = query.filter(prefix_range(models.Entry.pinyin_toned, pinyin))
+        return query, models.Entry.pinyin_toned == pinyin
+
+    toneless = " ".join(strip_tones(syllable) for syllable in syllables)
+    query = query.filter(prefix_range(models.Entry.pinyin_toneless, toneless))
+    if any(toned):
+        # check the tones that were given on the (few) rows in the range
+        # e.g., ji1 lei -> "ji1 lei%" and ji lei3 -> "ji_ lei3%"
+        pattern = " ".join(
+            syllable if has_tone or i == len(syllables) - 1 else syllable + "_"
+            for i, (syllable, has_tone) in enumerate(zip(syllables, toned))
+        )
+        query = query.filter(models.Entry.pinyin_toned.like(pattern + "%"))
+    return query, models.Entry.pinyin_toneless == toneless
+
+
+def match_mixed(db: Session, query, keyword: str):
+    """Restrict a query of entries to the ones starting with the characters and pinyin
+
+    e.g., 好kan, 好ka and hao看 all match 好看 (hao3 kan4). The matching ids come from
+    the in-memory position index, so this is about as fast as the other searches.
+    Also returns the condition for the entry matching the keyword exactly.
+    """
+    keyword = normalization.normalize_script(keyword, lookups.get_script_table(db))
+    tokens = planner.tokenize_query(keyword)
+    if not tokens:
+        return query.filter(false()), None
+
+    # the last syllable may be incomplete while typing, unless the keyword ends with a character
+    prefix = not is_chinese_script(keyword[-1])
+    entry_ids = lookups.get_position_index(db).search(tokens, prefix)
+    query = query.filter(models.Entry.id.in_(entry_ids))
+    return query, models.Entry.character_count == len(tokens)
+
+
+def match_characters(db: Session, query, keyword: str):
+    """Restrict a query of entries to the ones containing the characters
+
+    The matching ids come from the in-memory position index, since a
+    LIKE '%keyword%' filter can't use an index and would scan every entry.
+    Also returns the condition for the entry matching the keyword exactly.
+    """
+    keyword = normalization.normalize_script(keyword, lookups.get_script_table(db))
+    entry_ids = lookups.get_position_index(db).search_anywhere(list(keyword))
+    query = query.filter(models.Entry.id.in_(entry_ids))
+    return query, models.Entry.normalized == keyword
+
+
+# shorter words first, then more frequent ones (in the order of their composite index)
+ENTRY_RANKING = (
+    models.Entry.character_count,
+    models.Entry.frequency_rank,
+    models.Entry.id,
+)
+
+
+def ranked_entries(query, exact, limit: int) -> list:
+    """Get the top entries: exact matches first, then the rest by ENTRY_RANKING
+
+    Both parts are read in index order and stop after limit rows, instead of
+    fetching every match (e.g., thousands for a single syllable) to sort them.
+    """
+    rows = []
+    if exact is not None:
+        rows = (
+            query.filter(exact)
+            .order_by(models.Entry.frequency_rank, models.Entry.id)
+            .limit(limit)
+            .all()
+        )
+        query = query.filter(not_(exact))
+    if len(rows) < limit:
+        rows += query.order_by(*ENTRY_RANKING).limit(limit - len(rows)).all()
+    return rows
 
-    # need to parse the search string and then map that to the individual components
-    # for example, ji1lei3 (积累) should be parsed into "ji1" and "lei3"
-    # note that the position of each part is also important
-    # so ji1 should be part 0 and lei3 should be part 1 with the same entry id
-    # this mapping with designate a matching result and would be part of the search results
 
-    # if the user omits tones, then the search query would be jilei
-    # the hardest part would probably be parsing this output
-    # find the matching pinyin would just be a matter of excluding the tones from database searches
-    # "ji" and "lei" would just be matched with starts_with() or its equivalent
+def get_dictionary_entries(
+    db: Session, limit: int = 20, keyword: str = None, after_id: int = None
+):
+    """Get all dictionary entries
 
-    # another case would be "ji lei"
-    # you can just split along whitespace for this case
+    Full matches come first (e.g., "zhe" lists "zhe4" before "zheng4"), then shorter
+    words before longer ones and more frequent words before rarer ones.
+    If after_id is given, the entries after it are returned in id order instead,
+    with one extra row to tell whether there is a next page.
+    """
 
-    # TODO: figure out how to search if there is hanzi mixed with pinyin
-    # probably best to implement pinyin search first since this supposedly targeting mandarin learners
+    query = db.query(models.Entry.id, models.Entry.simplified, models.Entry.traditional)
+    exact = None
+    if keyword:  # search by query if it exists
+        # search the characters if there are any, otherwise the pinyin
+        # and both for keywords that mix them
+        if planner.is_mixed_query(keyword):
+            query, exact = match_mixed(db, query, keyword)
+        elif is_chinese_script(keyword):
+            query, exact = match_characters(db, query, keyword)
+        else:
+            query, exact = match_pinyin(query, keyword)
 
-    # search the entries table if trying to find matching characters
-    # otherwise, search through the pronunciations table
+    if after_id is not None:
+        rows = keyset_page(query, models.Entry.id, after_id, limit)
+    else:
+        rows = ranked_entries(query, exact, limit)
+    return entry_payloads(db, rows)
 
-    # TODO:
-    # prioritize full matches over partial matches e.g., "zhe" lists "zhe4" instead of "zheng4"
-    # words with fewer syllables should be listed before longer ones e.g., "zhe" before "zheshi" for keyword "zhe"
-    # this has lower precedence than the other two - sorting by frequency (this requires a frequency list)
-    #
 
-    # TODO: clean up this logic; it's way too messy
-    if keyword:  # search by query if it exists
-        if is_chinese_script(keyword):
-            query = db.query(models.Entry).filter(models.Entry.simplified.contains(keyword))
-            return query.limit(limit).all()
-        else:
-            # the input would be a list of the pinyin components
-            # so it would basically be ["ji1", "lei3"] or ["ji", "lei"]
-            # it would then match each of these parts to the index e.g., ji -> 0 and lei -> 1
-
-            pinyin_list = parse_pinyin(keyword)
-
-            position_pinyin_pairs = [(i, p) for i, p in enumerate(pinyin_list)]
-
-            query = db.query(models.Pronunciation.entry_id)
-            for position, pinyin in position_pinyin_pairs:
-                # running query multiple times shouldn't be too much of an issue since pairs are limited
-                query = query.filter(
-                    # make sure that both the position and the pinyin match
-                    models.Pronunciation.position == position,
-                    models.Pronunciation.pinyin.like(f'{pinyin}%')  # starts_with instead of exact match
-                    # e.g., "hao" keyword should also match "hao3" in the database
-                )
+def get_entries_by_definition(db: Session, english: str, limit: int = 20) -> list[dict]:
+    """Get the entries with a definition containing all the English words/"phrases"
+
+    Entries are ranked by the position of their first matching definition (their
+    main meaning before secondary ones), then by word frequency, then by relevance.
+    """
+    terms = search.definition_terms(english)
+    if not terms:
+        return []
 
+    query = db.query(models.Definition.entry_id, models.Definition.position)
+    matched = search.match_definitions(db, query, terms)
+    if matched is not None:
+        query, relevance = matched
     else:
-        query = db.query(models.Entry)
-        return query.limit(limit).all()
+        # scan the definitions when there is no full-text index (without stemming)
+        query = query.filter(
+            *[models.Definition.definition.contains(term, autoescape=True) for term in terms]
+        )
+        relevance = literal(0)
+
+    # materialized so that SQLite computes bm25 within the full-text query
+    matches = query.add_columns(relevance.label("relevance")).cte("matches")
+    matches = matches.prefix_with("MATERIALIZED")
+    rows = (
+        db.query(models.Entry.id, models.Entry.simplified, models.Entry.traditional)
+        .join(matches, matches.c.entry_id == models.Entry.id)
+        .group_by(models.Entry.id)
+        .order_by(
+            func.min(matches.c.position),
+            models.Entry.frequency_rank,
+            func.min(matches.c.relevance),
+            models.Entry.id,
+        )
+        .limit(limit)
+        .all()
+    )
+    return entry_payloads(db, rows)
+
+
+# keep the number of bound parameters per IN clause well below SQLite's limit
+IN_CLAUSE_BATCH_SIZE = 500
+
+
+def entry_payloads(db: Session, rows) -> list[dict]:
+    """Turn (id, simplified, traditional) rows into entries shaped like schemas.Entry
+
+    The pronunciations and definitions of every batch of entries are fetched with
+    one query each instead of being lazy loaded per entry, and only the columns in
+    the response are selected.
+    """
+    payloads = {
+        entry_id: {
+            "id": entry_id,
+            "simplified": simplified,
+            "traditional": traditional,
+            "pronunciations": [],
+            "definitions": [],
+        }
+        for entry_id, simplified, traditional in rows
+    }
+
+    entry_ids = list(payloads)
+    for i in range(0, len(entry_ids), IN_CLAUSE_BATCH_SIZE):
+        batch = entry_ids[i:i + IN_CLAUSE_BATCH_SIZE]
+        pronunciations = (
+            db.query(
+                models.Pronunciation.entry_id,
+                models.Pronunciation.pinyin,
+                models.Pronunciation.position,
+            )
+            .filter(models.Pronunciation.entry_id.in_(batch))
+            .order_by(models.Pronunciation.position, models.Pronunciation.id)
+        )
+        for entry_id, pinyin, position in pronunciations:
+            payloads[entry_id]["pronunciations"].append(
+                {"pinyin": pinyin, "position": position}
+            )
+
+        definitions = (
+            db.query(models.Definition.entry_id, models.Definition.definition)
+            .filter(models.Definition.entry_id.in_(batch))
+            .order_by(models.Definition.id)
+        )
+        for entry_id, definition in definitions:
+            payloads[entry_id]["definitions"].append({"definition": definition})
+
+    return list(payloads.values())
+
 
-    entries = [row.entry_id for row in query.all()]
-    return db.query(models.Entry).filter(models.Entry.id.in_(entries)).all()  # return as list of Entries
+def get_entry_payloads(db: Session, entry_ids: list[int]) -> list[dict]:
+    """Get entries shaped like schemas.Entry, in the order of the ids"""
+    rows = []
+    for i in range(0, len(entry_ids), IN_CLAUSE_BATCH_SIZE):
+        rows += (
+            db.query(models.Entry.id, models.Entry.simplified, models.Entry.traditional)
+            .filter(models.Entry.id.in_(entry_ids[i:i + IN_CLAUSE_BATCH_SIZE]))
+            .all()
+        )
+    payloads = {entry["id"]: entry for entry in entry_payloads(db, rows)}
+    return [payloads[i] for i in entry_ids if i in payloads]
+
+
+def get_entries_by_words(db: Session, words: list[str]) -> dict[str, list[models.Entry]]:
+    """Get the dictionary entries for many words at once (simplified or traditional)"""
+    words = list(set(words))
+    entries_by_word = {}
+
+    # one IN query per batch, plus one query each for pronunciations and definitions
+    # instead of one query per word (and two more per entry to lazy load its fields)
+    for i in range(0, len(words), IN_CLAUSE_BATCH_SIZE):
+        batch = words[i:i + IN_CLAUSE_BATCH_SIZE]
+        entries = (
+            db.query(models.Entry)
+            .filter(
+                or_(
+                    models.Entry.simplified.in_(batch),
+                    models.Entry.traditional.in_(batch),
+                )
+            )
+            .options(
+                selectinload(models.Entry.pronunciations),
+                selectinload(models.Entry.definitions),
+            )
+            .order_by(models.Entry.id)
+            .all()
+        )
+
+        batch = set(batch)
+        for entry in entries:
+            for word in {entry.simplified, entry.traditional} & batch:
+                entries_by_word.setdefault(word, []).append(entry)
+
+    return entries_by_word
 
 
 def create_word_list(db: Session, name: str, user_id: int):
@@ -138,6 +538,79 @@ def get_word_lists(db: Session, user_id: int):
     return db.query(models.WordList).filter(models.WordList.user_id == user_id).all()
 
 
+def get_word_list_payloads(
+    db: Session, user_id: int = None, wordlist_id: int = None
+) -> list[dict]:
+    """Get word lists with their entries, shaped like schemas.WordList
+
+    The entries of all the lists are fetched together in a fixed number of queries.
+    """
+    query = db.query(
+        models.WordList.id,
+        models.WordList.name,
+        models.WordList.time_modified,
+        models.WordList.time_created,
+    )
+    if user_id is not None:
+        query = query.filter(models.WordList.user_id == user_id)
+    if wordlist_id is not None:
+        query = query.filter(models.WordList.id == wordlist_id)
+
+    word_lists = {
+        wordlist_id: {
+            "id": wordlist_id,
+            "name": name,
+            "time_modified": time_modified.isoformat(),
+            "time_created": time_created.isoformat(),
+            "entries": [],
+        }
+        for wordlist_id, name, time_modified, time_created in query.order_by(
+            models.WordList.id
+        )
+    }
+    if not word_lists:
+        return []
+
+    links = (
+        db.query(models.wordlist_entries.c.wordlist_id, models.wordlist_entries.c.entry_id)
+        .filter(models.wordlist_entries.c.wordlist_id.in_(list(word_lists)))
+        .order_by(models.wordlist_entries.c.entry_id)
+        .all()
+    )
+    entry_ids = list(dict.fromkeys(entry_id for _, entry_id in links))
+    entries = {entry["id"]: entry for entry in get_entry_payloads(db, entry_ids)}
+    for wordlist_id, entry_id in links:
+        if entry_id in entries:
+            word_lists[wordlist_id]["entries"].append(entries[entry_id])
+
+    return list(word_lists.values())
+
+
+def get_word_list_words(db: Session, user_id: int) -> list[dict]:
+    """Get the words (simplified and traditional) in each of the user's word lists"""
+    rows = (
+        db.query(
+            models.WordList.id,
+            models.WordList.name,
+            models.Entry.simplified,
+            models.Entry.traditional,
+        )
+        .outerjoin(models.WordList.entries)
+        .filter(models.WordList.user_id == user_id)
+        .order_by(models.WordList.id)
+        .all()
+    )
+
+    word_lists = {}
+    for wordlist_id, name, simplified, traditional in rows:
+        word_list = word_lists.setdefault(
+            wordlist_id, {"id": wordlist_id, "name": name, "words": set()}
+        )
+        word_list["words"].update(word for word in (simplified, traditional) if word)
+
+    return list(word_lists.values())
+
+
 def get_entry_word_lists(db: Session, entry_id: int, user_id: int):
     """Get all word lists that contain the specified entry"""
     entry = db.query(models.Entry).filter(models.Entry.id == entry_id).first()
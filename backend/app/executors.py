@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from backend.app import segmenter
+
+# Segmentation is CPU-bound and holds the GIL, so bulk work is spread over
+# a pool of worker processes instead of the default threadpool.
+SEGMENTATION_WORKERS = int(os.getenv("SEGMENTATION_WORKERS", os.cpu_count() or 1))
+
+_segmentation_pool = None
+_segmentation_lock = threading.Lock()
+
+
+def get_segmentation_pool() -> ProcessPoolExecutor:
+    """Get the shared segmentation pool, starting it on first use"""
+    global _segmentation_pool
+    pool = _segmentation_pool
+    if pool is None:
+        with _segmentation_lock:
+            if _segmentation_pool is None:
+                # the server is already running threads, so the workers are started
+                # from a clean process instead of being forked, and load the dictionary
+                # themselves (from the prebuilt artifact)
+                _segmentation_pool = ProcessPoolExecutor(
+                    max_workers=SEGMENTATION_WORKERS,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                    initializer=segmenter.initialize,
+                )
+            pool = _segmentation_pool
+    return pool
+
+
+def map_segmentation(fn, texts: list[str]) -> list:
+    """Apply fn to every text in the segmentation pool, preserving order"""
+    if not texts:
+        return []
+
+    pool = get_segmentation_pool()
+    # send several documents per task so that small essays aren't dominated by IPC
+    chunksize = max(1, len(texts) // (SEGMENTATION_WORKERS * 4))
+    return list(pool.map(fn, texts, chunksize=chunksize))
+
+
+def shutdown_segmentation_pool():
+    global _segmentation_pool
+    with _segmentation_lock:
+        pool, _segmentation_pool = _segmentation_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when an executor's queue is full"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"The {name} executor is busy")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """Thread pool for one kind of work with a limit on queued tasks.
+
+    CPU-heavy routes run here instead of the shared threadpool so that a burst of
+    one kind of request can't starve the others. Once max_workers tasks are
+    running and max_queue are waiting, new tasks are rejected right away.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int = 1):
+        self.name = name
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool, or raise ExecutorSaturated if the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorSaturated(self.name, self.retry_after)
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def reserve(self) -> "Reservation":
+        """Hold a slot for a series of tasks, or raise ExecutorSaturated if the queue is full
+
+        e.g., for a streaming response, which has to be rejected before it starts.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorSaturated(self.name, self.retry_after)
+        return Reservation(self)
+
+
+class Reservation:
+    """A slot held in a BoundedExecutor until it is released"""
+
+    def __init__(self, executor: BoundedExecutor):
+        self._executor = executor
+        self._released = False
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool with the reserved slot"""
+        return await asyncio.wrap_future(self._executor._executor.submit(fn, *args))
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._executor._slots.release()
+
+
+# text analysis (jieba segmentation)
+analysis_executor = BoundedExecutor(
+    "analysis",
+    max_workers=int(os.getenv("ANALYSIS_THREADS", 4)),
+    max_queue=int(os.getenv("ANALYSIS_QUEUE", 32)),
+)
+
+# password hashing and verification (bcrypt)
+auth_executor = BoundedExecutor(
+    "auth",
+    max_workers=int(os.getenv("AUTH_THREADS", 2)),
+    max_queue=int(os.getenv("AUTH_QUEUE", 16)),
+)
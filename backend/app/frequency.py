@@ -0,0 +1,69 @@
+import collections
+import os
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+import backend.app.models as models
+from backend.app import executors, lookups, normalization, sentence_metrics
+from backend.app.database import SessionLocal
+
+# Word frequencies for ranking dictionary search results
+# The example sentences are segmented (in the normalized script, like the entries'
+# normalized column) and every entry is ranked by how often its word occurs, so
+# that common words come before rare ones with the same length.
+# Usage: python -m backend.app.frequency
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SENTENCES_FILE = os.path.join(BASE_DIR, "resources", "sentences.txt")
+
+UPDATE_BATCH_SIZE = 5000
+
+
+def count_words(db: Session, path: str = SENTENCES_FILE) -> collections.Counter:
+    """Count the Chinese words in a file with one sentence per line"""
+    table = lookups.get_script_table(db)
+    with open(path, "rt") as file:
+        texts = [normalization.normalize_script(line.strip(), table) for line in file]
+
+    counts = collections.Counter()
+    for words in executors.map_segmentation(sentence_metrics.sentence_tokens, texts):
+        counts.update(words)
+    return counts
+
+
+def rank_entries(rows, counts: collections.Counter) -> dict[int, int]:
+    """Rank (id, normalized word, character count) rows from the most frequent word
+
+    Every entry gets a distinct rank: entries whose word never occurs come last, and
+    ties go to shorter words, then to the lower id.
+    """
+    ranked = sorted(rows, key=lambda row: (-counts[row[1] or ""], row[2] or 0, row[0]))
+    return {entry_id: rank for rank, (entry_id, _, _) in enumerate(ranked, start=1)}
+
+
+def update_frequency_ranks(db: Session, path: str = SENTENCES_FILE) -> int:
+    """Compute and store the frequency rank of every entry"""
+    counts = count_words(db, path)
+    rows = db.query(
+        models.Entry.id, models.Entry.normalized, models.Entry.character_count
+    ).all()
+    ranks = list(rank_entries(rows, counts).items())
+
+    for i in range(0, len(ranks), UPDATE_BATCH_SIZE):
+        db.bulk_update_mappings(
+            models.Entry,
+            [
+                {"id": entry_id, "frequency_rank": rank}
+                for entry_id, rank in ranks[i:i + UPDATE_BATCH_SIZE]
+            ],
+        )
+    db.commit()
+    return len(counts)
+
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        count = update_frequency_ranks(db)
+    executors.shutdown_segmentation_pool()
+    print(f"Ranked the dictionary entries by the frequencies of {count} words")
@@ -1,15 +1,18 @@
+import codecs
+import collections
 import os
 import re
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
-import jieba
 import jwt
-import requests
 import zhon
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 
+from backend.app import segmenter
+from backend.app.cache import TwoTierCache, content_key
+
 # Maybe move security stuff to security.py or something like that?
 
 env_path = Path(__file__).resolve().parent / ".env"
@@ -41,9 +44,70 @@ def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def iter_split_text(text: str):
+    """Lazily split text using jieba and skip all punctuation"""
+    return segmenter.ENGINES[segmenter.DEFAULT_MODE].cut(text)
+
+
 def split_text(text: str) -> list[str]:
     """Split text using jieba and remove all punctuation"""
-    return list(filter(lambda w: w.isalnum(), jieba.lcut(text, cut_all=True)))
+    return list(iter_split_text(text))
+
+
+segmentation_cache = TwoTierCache(
+    "segmentation",
+    max_bytes=int(os.getenv("SEGMENTATION_CACHE_BYTES", 32 * 1024 * 1024)),
+    ttl=int(os.getenv("SEGMENTATION_CACHE_TTL", 24 * 60 * 60)),
+)
+
+
+def split_text_cached(text: str, engine: segmenter.SegmentationEngine | None = None) -> list[str]:
+    """Split text, reusing the result for identical text that was already split"""
+    engine = engine or segmenter.ENGINES[segmenter.DEFAULT_MODE]
+    # the engine and its dictionary are part of the key so that different
+    # segmentations (or ones with an older dictionary) don't collide
+    key = content_key(text, engine.name, engine.version)
+
+    words = segmentation_cache.get(key)
+    if words is None:
+        words = list(engine.cut(text))
+        segmentation_cache.set(key, words)
+
+    return words
+
+
+def count_words(text: str) -> collections.Counter:
+    """Split text and count how many times each word appears"""
+    return collections.Counter(split_text(text))
+
+
+# Streamed text is only segmented up to the last sentence boundary so that words
+# aren't cut in half between chunks. If there is no boundary for a while, the
+# buffer is flushed anyway to keep memory usage bounded.
+STREAM_BOUNDARY_REGEX = re.compile(r".*[\n。！？!?；;…]", re.DOTALL)
+STREAM_BUFFER_SIZE = 64 * 1024  # characters
+
+
+async def iter_text_segments(byte_chunks, max_buffer_size: int = STREAM_BUFFER_SIZE):
+    """Decode a stream of UTF-8 bytes into pieces of text ending at a sentence boundary"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    async for chunk in byte_chunks:
+        buffer += decoder.decode(chunk)
+
+        if match := STREAM_BOUNDARY_REGEX.match(buffer):
+            cut = match.end()
+        elif len(buffer) >= max_buffer_size:
+            cut = len(buffer)
+        else:
+            continue
+
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
 
 
 # def analyze_text(text: str) -> list[Entry]:
@@ -55,22 +119,6 @@ def split_text(text: str) -> list[str]:
 #     ]
 
 
-TRANSLATION_API_KEY = os.getenv("TRANSLATION_API_KEY")
-TRANSLATION_API_URL = os.getenv("TRANSLATION_API_URL")
-
-
-def translate_text(text: str, target_lang: str):
-    params = {
-        "auth_key": TRANSLATION_API_KEY,
-        "text": text,
-        "target_lang": target_lang,
-    }
-
-    response = requests.post(TRANSLATION_API_URL, data=params)
-    translated_text = response.json()["translations"][0]["text"]
-    return translated_text
-
-
 def is_chinese_script(characters):
     character_ranges = [
         (0x4E00, 0x9FFF),  # CJK Unified Ideographs
@@ -95,6 +143,25 @@ def parse_pinyin(pinyin: str) -> list[str]:
     return re.findall(zhon.pinyin.num_syl, pinyin, re.IGNORECASE)
 
 
+PINYIN_TONES = "12345"
+PINYIN_TONE_REGEX = re.compile(f"[{PINYIN_TONES}]")
+
+
+def normalize_pinyin(pinyin: str) -> str:
+    """Lowercase pinyin and write ü (u: in CEDICT) as v, like most keyboards do"""
+    return pinyin.lower().replace("u:", "v").replace("ü", "v")
+
+
+def strip_tones(pinyin: str) -> str:
+    return PINYIN_TONE_REGEX.sub("", pinyin)
+
+
+def pinyin_sequences(pronunciations: list[str]) -> tuple[str, str]:
+    """Get the toned and toneless syllable sequences of an entry e.g., ("ji1 lei3", "ji lei")"""
+    toned = " ".join(normalize_pinyin(pinyin) for pinyin in pronunciations)
+    return toned, strip_tones(toned)
+
+
 def get_video_id(youtube_url):
     pattern = r'(?:v=|\/embed\/|\/watch\?v=|\/watch\?.+&v=|youtu.be\/)([^#\&\?\/]{11})'
 
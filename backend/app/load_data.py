@@ -5,6 +5,14 @@ from pathlib import Path
 
 from sqlalchemy.orm import sessionmaker
 
+from backend.app import (
+    frequency,
+    lookups,
+    normalization,
+    postings,
+    search,
+    sentence_metrics,
+)
 from backend.app.database import engine
 from backend.app.models import Word, Entry, Sentence
 
@@ -57,6 +65,10 @@ def populate_hsk_lists(session, batch_size=3000):
 
     session.commit()
 
+    # make sure the shared lookup table doesn't serve stale levels, in the servers too
+    lookups.reload_hsk_lookup(session)
+    lookups.bump_data_version(session, "hsk")
+
 
 PARSE_REGEX = r"^\[(.*)\] /(.*)/$"  # always use raw strings for regex
 
@@ -123,30 +135,52 @@ def populate_dictionary(session):
                 )
                 session.add(entry)
 
+    # (re)build the full-text index over all definitions
+    search.create_definition_index(session.connection())
     session.commit()
 
+    lookups.reload_trie_engine(session)
+    lookups.reload_suggestion_index(session)
+
+    # the character mapping for searching is derived from the dictionary
+    normalization.populate_character_mappings(session)
+    normalization.normalize_entries(session)
+
+    # the servers rebuild their tables from the new dictionary as well
+    lookups.bump_data_version(session, "dictionary")
+
 
 def populate_sentences(session, batch_size=1000):
     """Store sentences from file into database"""
     # Source: https://tatoeba.org/en/downloads
 
+    script_table = lookups.get_script_table(session)
+
     with open(SENTENCES_FILE, "rt") as file:
         batch = []  # use batched operations to speed things up
         for line in file:
-            batch.append(Sentence(text=line.strip()))
+            text = line.strip()
+            text_normalized = normalization.normalize_script(text, script_table)
+            batch.append(Sentence(text=text, text_normalized=text_normalized))
             if len(batch) >= batch_size:
                 session.bulk_save_objects(batch)
                 batch.clear()
         if batch:
             session.bulk_save_objects(batch)
 
+    # (re)build the full-text index over all sentences
+    search.create_sentence_index(session.connection())
     session.commit()
+    lookups.reload_sentence_sort_keys(session)
 
 
 def populate_from_files(session):
     populate_hsk_lists(session)
     populate_dictionary(session)
     populate_sentences(session)
+    postings.build_postings(session)
+    sentence_metrics.update_sentence_metrics(session)
+    frequency.update_frequency_ranks(session)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,272 @@
+import hashlib
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import backend.app.models as models
+from backend.app import planner, segmenter, suggest
+
+# Read-only lookup tables that are shared by every request in the process.
+# Each table is built once (lazily on first use) and swapped out atomically
+# when the underlying data is reloaded, so readers never see a partial table.
+# The data is reloaded by other processes (e.g., load_data), which bump its version
+# in the database. Every process compares the versions with the ones it has seen,
+# at most every DATA_VERSION_INTERVAL seconds, and drops the outdated tables.
+
+DATA_VERSION_INTERVAL = float(os.getenv("DATA_VERSION_INTERVAL", 5))
+
+_lock = threading.Lock()
+_data_versions = None  # name -> version as of the last check
+_data_versions_checked = float("-inf")
+_hsk_lookup = None  # (lookup table, version) so that both are swapped together
+_trie_engine = None
+_sentence_sort_keys = {}
+_script_table = None
+_suggestion_index = None
+_position_index = None
+
+
+def bump_data_version(db: Session, name: str):
+    """Record that the data was reloaded, so that every process rebuilds its tables"""
+    updated = (
+        db.query(models.DataVersion)
+        .filter(models.DataVersion.name == name)
+        .update({models.DataVersion.version: models.DataVersion.version + 1})
+    )
+    if not updated:
+        db.add(models.DataVersion(name=name, version=1))
+    db.commit()
+
+
+def _drop_tables(name: str):
+    global _hsk_lookup, _trie_engine, _script_table, _suggestion_index, _position_index
+    if name == "hsk":
+        _hsk_lookup = None
+    elif name == "dictionary":
+        _trie_engine = None
+        _script_table = None
+        _suggestion_index = None
+        _position_index = None
+
+
+def check_data_versions(db: Session):
+    """Drop the tables whose data was reloaded since the last check"""
+    global _data_versions, _data_versions_checked
+    if time.monotonic() - _data_versions_checked < DATA_VERSION_INTERVAL:
+        return
+
+    with _lock:
+        if time.monotonic() - _data_versions_checked < DATA_VERSION_INTERVAL:
+            return  # checked by another thread in the meantime
+        versions = dict(db.query(models.DataVersion.name, models.DataVersion.version))
+        if _data_versions is not None:
+            for name in set(versions) | set(_data_versions):
+                if versions.get(name) != _data_versions.get(name):
+                    _drop_tables(name)
+        _data_versions = versions
+        _data_versions_checked = time.monotonic()
+
+
+def get_data_version(db: Session, name: str) -> int:
+    """Get how many times the data was reloaded (e.g., for cache keys)"""
+    check_data_versions(db)
+    return (_data_versions or {}).get(name, 0)
+
+
+def build_hsk_lookup(db: Session):
+    """Build an immutable mapping of simplified word -> HSK level"""
+    # only select the two columns that are needed instead of hydrating Word objects
+    rows = (
+        db.query(models.Word.simplified, models.Word.level_id)
+        .order_by(models.Word.id)
+        .all()
+    )
+    return MappingProxyType({simplified: level_id for simplified, level_id in rows})
+
+
+def _get_hsk_lookup(db: Session):
+    check_data_versions(db)
+    hsk_lookup = _hsk_lookup
+    if hsk_lookup is None:
+        with _lock:
+            if _hsk_lookup is None:  # another thread may have built it already
+                reload_hsk_lookup(db)
+            hsk_lookup = _hsk_lookup
+    return hsk_lookup
+
+
+def get_hsk_lookup(db: Session):
+    """Get the shared HSK lookup table, building it on first use"""
+    return _get_hsk_lookup(db)[0]
+
+
+def get_hsk_lookup_version(db: Session) -> str:
+    """Get a digest of the HSK lookup table's contents (e.g., for cache keys)"""
+    return _get_hsk_lookup(db)[1]
+
+
+def reload_hsk_lookup(db: Session):
+    """Rebuild the HSK lookup table (e.g., after the HSK lists are reloaded)"""
+    global _hsk_lookup
+    lookup = build_hsk_lookup(db)
+    version = hashlib.sha256(repr(sorted(lookup.items())).encode()).hexdigest()
+    _hsk_lookup = (lookup, version)
+    return lookup
+
+
+def build_trie_engine(db: Session) -> segmenter.TrieEngine:
+    """Build a maximum matching segmenter from the dictionary's words"""
+    rows = db.query(models.Entry.simplified, models.Entry.traditional).all()
+    words = sorted({word for row in rows for word in row if word})
+    version = hashlib.sha256("\n".join(words).encode()).hexdigest()
+    return segmenter.TrieEngine(words, version)
+
+
+def get_trie_engine(db: Session) -> segmenter.TrieEngine:
+    """Get the shared dictionary segmenter, building it on first use"""
+    check_data_versions(db)
+    engine = _trie_engine
+    if engine is None:
+        with _lock:
+            if _trie_engine is None:
+                reload_trie_engine(db)
+            engine = _trie_engine
+    return engine
+
+
+def reload_trie_engine(db: Session) -> segmenter.TrieEngine:
+    """Rebuild the dictionary segmenter (e.g., after the dictionary is reloaded)"""
+    global _trie_engine
+    _trie_engine = build_trie_engine(db)
+    return _trie_engine
+
+
+# sort keys for example sentences, by the name of the sort
+SENTENCE_SORT_KEYS = {
+    "length": func.length(models.Sentence.text),
+    "difficulty": models.Sentence.difficulty,
+}
+
+
+def build_sentence_sort_keys(db: Session, sort: str) -> np.ndarray:
+    """Build an array of sentence id -> sort key (inf for missing values)"""
+    rows = db.query(models.Sentence.id, SENTENCE_SORT_KEYS[sort]).all()
+    ids = np.fromiter((sentence_id for sentence_id, _ in rows), dtype=np.int64, count=len(rows))
+    keys = np.full(int(ids.max(initial=0)) + 1, np.inf)
+    keys[ids] = [np.inf if key is None else key for _, key in rows]
+    keys.flags.writeable = False
+    return keys
+
+
+def get_sentence_sort_keys(db: Session, sort: str) -> np.ndarray:
+    """Get the shared sort keys for sentences, building them on first use"""
+    keys = _sentence_sort_keys.get(sort)
+    if keys is None:
+        with _lock:
+            if sort not in _sentence_sort_keys:
+                _sentence_sort_keys[sort] = build_sentence_sort_keys(db, sort)
+            keys = _sentence_sort_keys[sort]
+    return keys
+
+
+def reload_sentence_sort_keys(db: Session):
+    """Rebuild the sort keys for sentences (e.g., after the sentences are reloaded)"""
+    global _sentence_sort_keys
+    _sentence_sort_keys = {
+        sort: build_sentence_sort_keys(db, sort) for sort in SENTENCE_SORT_KEYS
+    }
+
+
+def build_script_table(db: Session) -> dict[int, str]:
+    """Build a str.translate table from traditional to simplified characters"""
+    rows = db.query(models.CharacterMapping.traditional, models.CharacterMapping.simplified)
+    return {ord(traditional): simplified for traditional, simplified in rows}
+
+
+def get_script_table(db: Session) -> dict[int, str]:
+    """Get the shared script normalization table, building it on first use"""
+    check_data_versions(db)
+    table = _script_table
+    # an empty table isn't kept, the mapping may just not be populated yet
+    if not table:
+        with _lock:
+            if not _script_table:
+                reload_script_table(db)
+            table = _script_table
+    return table
+
+
+def reload_script_table(db: Session) -> dict[int, str]:
+    """Rebuild the script normalization table (e.g., after the mapping is rebuilt)"""
+    global _script_table
+    _script_table = build_script_table(db)
+    return _script_table
+
+
+def build_suggestion_index(db: Session) -> suggest.SuggestionIndex:
+    """Build the type-ahead index from the dictionary's words and pinyin"""
+    rows = db.query(
+        models.Entry.id,
+        models.Entry.simplified,
+        models.Entry.traditional,
+        models.Entry.pinyin_toned,
+    ).all()
+    return suggest.SuggestionIndex.from_entries(rows)
+
+
+def get_suggestion_index(db: Session) -> suggest.SuggestionIndex:
+    """Get the shared type-ahead index, building it on first use"""
+    check_data_versions(db)
+    index = _suggestion_index
+    if index is None:
+        with _lock:
+            if _suggestion_index is None:
+                reload_suggestion_index(db)
+            index = _suggestion_index
+    return index
+
+
+def reload_suggestion_index(db: Session) -> suggest.SuggestionIndex:
+    """Rebuild the type-ahead index (e.g., after the dictionary is reloaded)"""
+    global _suggestion_index
+    _suggestion_index = build_suggestion_index(db)
+    return _suggestion_index
+
+
+def build_position_index(db: Session) -> planner.PositionIndex:
+    """Build the index of characters and syllables by position for mixed searches"""
+    rows = db.query(
+        models.Entry.id, models.Entry.normalized, models.Entry.pinyin_toned
+    ).all()
+    return planner.PositionIndex.from_entries(rows)
+
+
+def get_position_index(db: Session) -> planner.PositionIndex:
+    """Get the shared position index, building it on first use"""
+    check_data_versions(db)
+    index = _position_index
+    if index is None:
+        with _lock:
+            if _position_index is None:
+                reload_position_index(db)
+            index = _position_index
+    return index
+
+
+def reload_position_index(db: Session) -> planner.PositionIndex:
+    """Rebuild the position index (e.g., after the dictionary is normalized again)"""
+    global _position_index
+    _position_index = build_position_index(db)
+    return _position_index
+
+
+def get_segmentation_engine(db: Session, mode: str) -> segmenter.SegmentationEngine:
+    """Get the segmentation engine for a mode"""
+    if mode == segmenter.TrieEngine.name:
+        return get_trie_engine(db)
+    return segmenter.ENGINES[mode]
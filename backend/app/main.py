@@ -1,20 +1,31 @@
 import collections
+import json
 import os
 import pickle
+import threading
+from contextlib import asynccontextmanager
 from datetime import timedelta
-from pathlib import Path
 from typing import Annotated
 
-import jieba
 import jwt
-import redis
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt import InvalidTokenError
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from starlette import status
+from starlette.background import BackgroundTask
 from youtube_transcript_api import (
     YouTubeTranscriptApi,
     NoTranscriptFound,
@@ -22,20 +33,20 @@ from youtube_transcript_api import (
     TranscriptsDisabled,
 )
 
+import backend.app.cache as cache
+import backend.app.coverage as coverage
 import backend.app.crud as crud
+import backend.app.executors as executors
 import backend.app.helpers as helpers
+import backend.app.lookups as lookups
+import backend.app.pagination as pagination
 import backend.app.schemas as schemas
+import backend.app.segmenter as segmenter
+import backend.app.translation as translation
+import backend.app.warm_translations as warm_translations
 from backend.app import models
-from backend.app.database import get_db
-
-# Set up file paths for jieba
-BASE_DIR = Path(__file__).resolve().parent.parent
-DICTIONARY_FILE = os.path.join(BASE_DIR, "resources", "dict.txt.big")
-
-# initialize jieba on startup
-jieba.setLogLevel(20)  # don't print initialization information
-jieba.set_dictionary(DICTIONARY_FILE)
-jieba.initialize()
+from backend.app.cache import r
+from backend.app.database import SessionLocal, get_db
 
 # Create some tags to group up endpoints at /docs
 tags_metadata = [
@@ -54,11 +65,40 @@ tags_metadata = [
     {"name": "transcript", "description": "Video transcriptions"},
 ]
 
-app = FastAPI(tags_metadata=tags_metadata)
+
+def build_search_indexes():
+    with SessionLocal() as db:
+        lookups.get_suggestion_index(db)
+        lookups.get_position_index(db)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm up the segmenter in the background so that health checks pass right away
+    # requests that need it before it's ready wait for it instead
+    threading.Thread(target=segmenter.initialize, daemon=True).start()
+    threading.Thread(target=build_search_indexes, daemon=True).start()
+    yield
+    # the segmentation pool is only started if a batch analysis was requested
+    executors.shutdown_segmentation_pool()
+    await translation.close_client()
+
+
+app = FastAPI(tags_metadata=tags_metadata, lifespan=lifespan)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+@app.exception_handler(executors.ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: executors.ExecutorSaturated):
+    # fail fast so that clients back off instead of piling up more requests
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, try again later."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)
 ):
@@ -81,12 +121,18 @@ def get_current_user(
     return user
 
 
-# Use redis to cache HSK lists
-redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-if os.getenv("REDIS_HOST") == "redis":  # If using Docker
-    redis_url = "redis://redis:6379"
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+
+def get_optional_user(
+    token: Annotated[str | None, Depends(optional_oauth2_scheme)],
+    db: Session = Depends(get_db),
+):
+    """Get the current user if there is a token (for routes that also work without one)"""
+    if token is None:
+        return None
+    return get_current_user(token, db)
 
-r = redis.from_url(redis_url)
 
 # Use localhost:3000 as the default host and port
 # The value for ALLOWED_ORIGINS is a comma-separated string of URIs
@@ -108,8 +154,7 @@ class UserCreate(BaseModel):
     password: str
 
 
-@router.post("/register")
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+def register_new_user(user_data: UserCreate, db: Session):
     user = db.query(models.User).filter_by(username=user_data.username).first()
     if user:
         raise HTTPException(status_code=400, detail="Username already registered")
@@ -119,11 +164,13 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 
-@router.post("/token")
-def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
-) -> schemas.Token:
+# hashing passwords is slow on purpose, so it runs in its own executor
+@router.post("/register")
+async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+    return await executors.auth_executor.run(register_new_user, user_data, db)
+
+
+def authenticate_user(form_data: OAuth2PasswordRequestForm, db: Session) -> schemas.Token:
     user = (
         db.query(models.User).filter(models.User.username == form_data.username).first()
     )
@@ -138,6 +185,28 @@ def login_for_access_token(
     return schemas.Token(access_token=access_token, token_type="bearer")
 
 
+@router.post("/token")
+async def login_for_access_token(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    db: Session = Depends(get_db),
+) -> schemas.Token:
+    return await executors.auth_executor.run(authenticate_user, form_data, db)
+
+
+@router.get("/health")
+def health_check():
+    """Check if the app is up (and if the segmenter is done warming up)."""
+    return {
+        "status": "ok",
+        "segmenter": "ready" if segmenter.is_ready() else "warming up",
+        "caches": {
+            "analyzer": analysis_cache.stats(),
+            "segmentation": helpers.segmentation_cache.stats(),
+            "translation": translation.translation_cache.stats(),
+        },
+    }
+
+
 @router.get("/verify-token")
 async def verify_token(current_user: schemas.User = Depends(get_current_user)):
     return {"valid": True}
@@ -169,10 +238,26 @@ class TranslatedSentence(schemas.Sentence):
 @router.get(
     "/sentence/{sentence_id}", response_model=TranslatedSentence, tags=["sentences"]
 )
-def get_sentence(sentence_id: int, db: Session = Depends(get_db)):
+async def get_sentence(
+    sentence_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+):
     """Get a specific sentence based on its ID."""
-    sentence = crud.get_sentence(db, sentence_id)
-    translated_sentence = helpers.translate_text(sentence, target_lang="EN")
+    sentence, translated_sentence = await run_in_threadpool(
+        crud.get_sentence_with_translation, db, sentence_id, "EN"
+    )
+    if sentence is None:
+        raise HTTPException(status_code=404, detail="Sentence not found")
+
+    # redis is blocking, so count the view in the threadpool after responding
+    background_tasks.add_task(warm_translations.record_view, sentence_id)
+
+    # not stored yet, so translate it now and keep it for next time
+    if translated_sentence is None:
+        translated_sentence = await translation.translate_text(sentence.text, target_lang="EN")
+        await run_in_threadpool(
+            crud.save_sentence_translations, db, "EN", {sentence_id: translated_sentence}
+        )
+
     return {
         "id": sentence_id,
         "text": sentence.text,
@@ -181,28 +266,146 @@ def get_sentence(sentence_id: int, db: Session = Depends(get_db)):
 
 
 # TODO: allow the user to search for characters in a string
-# Also, try to normalize simplified and traditional characters
-@router.get("/sentences", response_model=list[schemas.Sentence], tags=["sentences"])
+@router.get(
+    "/sentences",
+    response_model=list[schemas.Sentence] | schemas.SentencePage,
+    tags=["sentences"],
+)
 def get_sentences(
     db: Session = Depends(get_db),
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=50000),
     offset: int = 0,
     keyword: str = None,
+    cursor: str = None,
+    max_level: int = None,
+    max_unknown_ratio: float = None,
+    sort: crud.SentenceSort = None,
 ):
-    """Get all sentences (subject to limit/keyword)."""
-    sentences = crud.get_sentences(db, limit, offset, keyword)
-    return sentences
+    """Get all sentences (subject to limit/keyword).
+
+    Sentences can be filtered by their highest HSK level and their share of words
+    outside the HSK lists, and sorted by difficulty.
+    If cursor is given (empty for the first page), a page of sentences is
+    returned along with the cursor for the next page.
+    """
+    filters = {"max_level": max_level, "max_unknown_ratio": max_unknown_ratio, "sort": sort}
+    if cursor is None:  # offset pagination
+        return crud.get_sentences(db, limit, offset, keyword, **filters)
 
+    keys = crud.sentence_cursor_keys(sort)
+    after = decode_cursor(cursor, *keys)
+    sentences = crud.get_sentences(db, limit, keyword=keyword, after=after, **filters)
+    return pagination.make_page(sentences, limit, keys)
 
-@router.get("/dictionary", response_model=list[schemas.Entry], tags=["dictionary"])
+
+@router.get(
+    "/dictionary",
+    response_model=list[schemas.Entry] | schemas.EntryPage,
+    tags=["dictionary"],
+)
 def get_dictionary_entries(
     db: Session = Depends(get_db),
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=10000),
     keyword: str = None,
+    cursor: str = None,
+    english: str = None,
+):
+    """Get all entries in a dictionary (subject to limit/keyword).
+
+    If cursor is given (empty for the first page), a page of entries in id
+    order is returned along with the cursor for the next page.
+    If english is given, the entries are searched by their definitions instead
+    (words match other forms e.g., "studies" matches "to study", "quote" phrases).
+    """
+    if english:
+        if keyword or cursor is not None:
+            raise HTTPException(
+                status_code=400, detail="english can't be combined with keyword or cursor"
+            )
+        return json_response(crud.get_entries_by_definition(db, english, limit))
+
+    if cursor is None:
+        return json_response(crud.get_dictionary_entries(db, limit, keyword))
+
+    after = decode_cursor(cursor, "id")
+    entries = crud.get_dictionary_entries(db, limit, keyword, after_id=after.get("id", 0))
+    return json_response(pagination.make_page(entries, limit))
+
+
+def json_response(content) -> Response:
+    """Serialize plain data straight to JSON
+
+    For large responses that are built in the shape of their response model,
+    validating every item again with pydantic would cost more than the queries.
+    """
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+    return Response(body.encode(), media_type="application/json")
+
+
+def decode_cursor(cursor: str, *keys: str) -> dict:
+    try:
+        return pagination.decode_cursor(cursor, *keys)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    "/dictionary/suggest",
+    response_model=list[schemas.EntrySuggestion],
+    tags=["dictionary"],
+)
+def suggest_dictionary_entries(
+    keyword: str,
+    db: Session = Depends(get_db),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """Get entries starting with the keyword (characters or pinyin) while typing."""
+    entry_ids = lookups.get_suggestion_index(db).search(keyword, limit)
+    return crud.get_entry_suggestions(db, entry_ids)
+
+
+@router.get(
+    "/dictionary/{entry_id}/sentences",
+    response_model=list[schemas.Sentence],
+    tags=["dictionary"],
+)
+def get_entry_sentences(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    sort: crud.ExampleSort = "length",
+):
+    """Get example sentences containing a dictionary entry (simplified or traditional)."""
+    entry = crud.get_entry(db, entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Entry not found")
+
+    return crud.get_example_sentences(
+        db, [entry.simplified, entry.traditional], limit, offset, sort
+    )
+
+
+@router.get(
+    "/words/{word_id}/sentences",
+    response_model=list[schemas.Sentence],
+    tags=["word_lists"],
+)
+def get_word_sentences(
+    word_id: int,
+    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    sort: crud.ExampleSort = "length",
 ):
-    """Get all entries in a dictionary (subject to limit/keyword)."""
-    entries = crud.get_dictionary_entries(db, limit, keyword)
-    return entries
+    """Get example sentences containing an HSK word (simplified or traditional)."""
+    word = crud.get_hsk_word(db, word_id)
+    if word is None:
+        raise HTTPException(status_code=404, detail="Word not found")
+
+    return crud.get_example_sentences(
+        db, [word.simplified, word.traditional], limit, offset, sort
+    )
 
 
 # Define a Pydantic model for the request body
@@ -210,49 +413,221 @@ class TextInput(BaseModel):
     text: str
 
 
+class BatchTextInput(BaseModel):
+    texts: list[str]
+
+
+analysis_cache = cache.TwoTierCache(
+    "analyzer",
+    max_bytes=int(os.getenv("ANALYZER_CACHE_BYTES", 32 * 1024 * 1024)),
+    ttl=int(os.getenv("ANALYZER_CACHE_TTL", 24 * 60 * 60)),
+)
+
+
+def get_word_info(word_counts: collections.Counter, hsk_lookup) -> list[dict]:
+    """Convert word counts into a list of words sorted by frequency"""
+    return [
+        {
+            "word": word,
+            "count": count,
+            "hsk_level": hsk_lookup.get(word),  # this returns None for non-HSK words
+        }
+        for word, count in word_counts.most_common()
+    ]
+
+
+# Segmentation is CPU-bound, so the analyzer routes run in their own executor
+# and are rejected with a 503 when it's too busy instead of queueing forever.
+
+
+def analyze_text(user_input: TextInput, mode: str, enrich: bool, db: Session):
+    try:
+        received_text = cache.normalize_text(user_input.text)
+
+        # shared lookup table mapping simplified form to hsk level
+        # this is built once per process instead of querying all HSK words per request
+        hsk_lookup = lookups.get_hsk_lookup(db)
+
+        # the same texts tend to be analyzed over and over again
+        cache_key = cache.content_key(
+            received_text,
+            mode,
+            lookups.get_hsk_lookup_version(db),
+            str(lookups.get_data_version(db, "dictionary")),
+            "enriched" if enrich else "plain",
+        )
+        word_info = analysis_cache.get(cache_key)
+        if word_info is not None:
+            return word_info
+
+        engine = lookups.get_segmentation_engine(db, mode)
+        word_counts = collections.Counter(helpers.split_text_cached(received_text, engine))
+        word_info = get_word_info(word_counts, hsk_lookup)
+
+        if enrich:
+            entries_by_word = crud.get_entries_by_words(db, list(word_counts))
+            for info in word_info:
+                info["entries"] = [
+                    schemas.Entry.model_validate(entry, from_attributes=True).model_dump()
+                    for entry in entries_by_word.get(info["word"], [])
+                ]
+
+        analysis_cache.set(cache_key, word_info)
+        return word_info
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/analyzer", tags=["analyzer"])
-def analyze_text_submit(user_input: TextInput, db: Session = Depends(get_db)):
-    """Split and analyze user text."""
+async def analyze_text_submit(
+    user_input: TextInput,
+    mode: segmenter.SegmentationMode = segmenter.DEFAULT_MODE,
+    enrich: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Split and analyze user text.
+
+    If enrich is set, the dictionary entries (pronunciations and definitions)
+    for every word are included as well.
+    """
+    return await executors.analysis_executor.run(analyze_text, user_input, mode, enrich, db)
+
+
+def analyze_coverage(user_input: TextInput, current_user: models.User | None, mode: str, db: Session):
     try:
-        received_text = user_input.text
-        split_text = helpers.split_text(received_text)
+        received_text = cache.normalize_text(user_input.text)
+        engine = lookups.get_segmentation_engine(db, mode)
+        word_counts = collections.Counter(helpers.split_text_cached(received_text, engine))
+
+        word_lists = []
+        if current_user is not None:
+            word_lists = crud.get_word_list_words(db, user_id=current_user.id)
+
+        return coverage.compute_coverage(
+            word_counts, lookups.get_hsk_lookup(db), word_lists
+        )
 
-        word_counts = collections.Counter(split_text)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # get all words at once to avoid the N+1 query problem
-        hsk_words = crud.get_hsk_words(db)
 
-        words_sorted_by_frequency = word_counts.most_common()
+@router.post("/analyzer/coverage", tags=["analyzer"])
+async def analyze_text_coverage(
+    user_input: TextInput,
+    current_user: Annotated[models.User | None, Depends(get_optional_user)],
+    mode: segmenter.SegmentationMode = segmenter.DEFAULT_MODE,
+    db: Session = Depends(get_db),
+):
+    """Get how much of the text is covered by each HSK level (and word list).
+
+    Coverage for the user's word lists is only included when logged in.
+    """
+    return await executors.analysis_executor.run(
+        analyze_coverage, user_input, current_user, mode, db
+    )
 
-        # create a lookup table mapping simplified form to hsk level
-        hsk_lookup = {word.simplified: word.level_id for word in hsk_words}
 
-        word_info = [
-            {
-                "word": word,
-                "count": count,
-                "hsk_level": hsk_lookup.get(
-                    word
-                ),  # this returns None for non-HSK words
-            }
-            for word, count in words_sorted_by_frequency
-        ]
+def analyze_batch(user_input: BatchTextInput, db: Session):
+    try:
+        hsk_lookup = lookups.get_hsk_lookup(db)
 
-        return word_info
+        # segmentation is spread over worker processes since jieba is CPU-bound
+        document_counts = executors.map_segmentation(
+            helpers.count_words, user_input.texts
+        )
+
+        corpus_counts = collections.Counter()
+        for word_counts in document_counts:
+            corpus_counts.update(word_counts)
+
+        return {
+            "documents": [
+                get_word_info(word_counts, hsk_lookup) for word_counts in document_counts
+            ],
+            "corpus": get_word_info(corpus_counts, hsk_lookup),
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/analyzer/batch", tags=["analyzer"])
+async def analyze_batch_submit(user_input: BatchTextInput, db: Session = Depends(get_db)):
+    """Split and analyze many texts in parallel."""
+    return await executors.analysis_executor.run(analyze_batch, user_input, db)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """Streaming response for endpoints that are still reading the request body.
+
+    StreamingResponse may listen for a disconnect by reading from receive(),
+    which would swallow the body chunks that the endpoint is waiting for.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            # even if the client went away, e.g., to release resources held for the stream
+            if self.background is not None:
+                await self.background()
+
+
+@router.post("/analyzer/stream", tags=["analyzer"])
+async def analyze_text_stream(
+    request: Request,
+    progress: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Split and analyze a (chunked) plain text body incrementally.
+
+    The response is newline-delimited JSON. If progress is set, a progress
+    frame is sent after each piece of text is processed. The last frame
+    always contains the results.
+    """
+    # the session is closed once streaming starts, so get the lookup table first
+    hsk_lookup = await run_in_threadpool(lookups.get_hsk_lookup, db)
+    # once the response starts it can't be a 503 anymore, so take a slot up front
+    reservation = executors.analysis_executor.reserve()
+
+    async def frames():
+        word_counts = collections.Counter()
+        characters = 0
+
+        async for text in helpers.iter_text_segments(request.stream()):
+            # only the running counts are kept, not the text or the list of words
+            await reservation.run(word_counts.update, helpers.iter_split_text(text))
+            characters += len(text)
+
+            if progress:
+                frame = {
+                    "type": "progress",
+                    "characters": characters,
+                    "words": word_counts.total(),
+                    "unique_words": len(word_counts),
+                }
+                yield json.dumps(frame, ensure_ascii=False) + "\n"
+
+        frame = {"type": "result", "words": get_word_info(word_counts, hsk_lookup)}
+        yield json.dumps(frame, ensure_ascii=False) + "\n"
+
+    return BodyStreamingResponse(
+        frames(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(reservation.release),
+    )
+
+
 # POST endpoint to receive text from the React form
 @router.post("/translator", tags=["translator"])
-def submit_text(user_input: TextInput):
+async def submit_text(user_input: TextInput):
     """Translates user text."""
     # Process the text here (e.g., save to database, etc.)
     try:
         received_text = user_input.text
         # translate to chinese
-        translated_text = helpers.translate_text(received_text, target_lang="ZH")
+        translated_text = await translation.translate_text(received_text, target_lang="ZH")
 
         return {"original_text": received_text, "translated_text": translated_text}
 
@@ -285,11 +660,11 @@ def read_wordlist(
     if not current_user:
         return HTTPException(status_code=403, detail="Not authorized.")
 
-    db_wordlist = crud.get_word_list(db, wordlist_id=wordlist_id)
-    if db_wordlist is None:
+    db_wordlists = crud.get_word_list_payloads(db, wordlist_id=wordlist_id)
+    if not db_wordlists:
         raise HTTPException(status_code=404, detail="Wordlist not found")
 
-    return db_wordlist
+    return json_response(db_wordlists[0])
 
 
 @router.delete("/wordlists/{wordlist_id}", tags=["user_lists"])
@@ -305,8 +680,8 @@ def read_wordlists(
     db: Session = Depends(get_db),
 ):
     """Get all wordlists for a user."""
-    db_wordlists = crud.get_word_lists(db, user_id=current_user.id)
-    return db_wordlists
+    db_wordlists = crud.get_word_list_payloads(db, user_id=current_user.id)
+    return json_response(db_wordlists)
 
 
 # TODO: come up with a better endpoint
@@ -1,7 +1,18 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Table
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+)
 from sqlalchemy.orm import relationship
 
 from backend.app.database import Base
+from backend.app.helpers import pinyin_sequences
 
 # Association table for dictionary entries and user-defined vocab lists
 wordlist_entries = Table(
@@ -28,17 +39,75 @@ class Sentence(Base):
 
     id = Column(Integer, primary_key=True)
     text = Column(String, index=True)
+    # text with traditional characters converted to simplified, for searching
+    # (indexed by the full-text index, see search.py)
+    text_normalized = Column(String)
+
+    # difficulty metrics, see sentence_metrics.py
+    token_count = Column(Integer, index=True)
+    max_hsk_level = Column(Integer, index=True)
+    unknown_ratio = Column(Float, index=True)
+    difficulty = Column(Float, index=True)
+
+    # e.g., sentences up to HSK 3 from easiest to hardest
+    __table_args__ = (
+        Index("ix_sentences_max_hsk_level_difficulty", "max_hsk_level", "difficulty"),
+    )
 
     def __repr__(self):
         return self.text
 
 
+class SentenceTranslation(Base):
+    __tablename__ = "sentence_translations"
+
+    # the primary key doubles as the index for looking up a sentence's translation
+    sentence_id = Column(Integer, ForeignKey("sentences.id"), primary_key=True)
+    target_lang = Column(String, primary_key=True)
+    text = Column(String, nullable=False)
+
+
+class SentencePosting(Base):
+    __tablename__ = "sentence_postings"
+
+    # sentence ids containing the word, see postings.encode_postings
+    word = Column(String, primary_key=True)
+    sentence_count = Column(Integer, nullable=False)
+    sentence_ids = Column(LargeBinary, nullable=False)
+
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    # bumped whenever the data is reloaded, see lookups.bump_data_version
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+
+class CharacterMapping(Base):
+    __tablename__ = "character_mappings"
+
+    # traditional character -> simplified character, see normalization.py
+    traditional = Column(String, primary_key=True)
+    simplified = Column(String, nullable=False)
+
+
 class Entry(Base):
     __tablename__ = "entries"
 
     id = Column(Integer, primary_key=True, index=True)
     simplified = Column(String, index=True)
     traditional = Column(String, index=True)
+    # simplified form in the same normalized script as search keywords
+    normalized = Column(String, index=True)
+    # lowercase syllables separated by spaces, e.g., "ji1 lei3" and "ji lei"
+    # so that a multi-syllable search is a single range scan over the index
+    pinyin_toned = Column(String, index=True)
+    pinyin_toneless = Column(String, index=True)
+    # search results are ranked shorter words first, then more frequent ones
+    # 1 is the most frequent word in the example sentences (see backend.app.frequency)
+    character_count = Column(Integer)
+    frequency_rank = Column(Integer)
 
     pronunciations = relationship("Pronunciation", back_populates="entry")
     definitions = relationship("Definition", back_populates="entry")
@@ -47,16 +116,32 @@ class Entry(Base):
         "WordList", secondary=wordlist_entries, back_populates="entries"
     )
 
+    __table_args__ = (
+        Index(
+            "ix_entries_character_count_frequency_rank",
+            "character_count",
+            "frequency_rank",
+        ),
+    )
+
     @classmethod
     def create(cls, simplified, traditional, pronunciations, definitions):
-        entry = cls(simplified=simplified, traditional=traditional)
+        pinyin_toned, pinyin_toneless = pinyin_sequences(pronunciations)
+        entry = cls(
+            simplified=simplified,
+            traditional=traditional,
+            character_count=len(simplified),
+            pinyin_toned=pinyin_toned,
+            pinyin_toneless=pinyin_toneless,
+        )
         entry.pronunciations = [
             Pronunciation(pinyin=pinyin, position=i)
             for i, pinyin in enumerate(pronunciations)
         ]
 
         entry.definitions = [
-            Definition(definition=definition) for definition in definitions
+            Definition(definition=definition, position=i)
+            for i, definition in enumerate(definitions)
         ]
 
         return entry
@@ -86,6 +171,8 @@ class Definition(Base):
     id = Column(Integer, primary_key=True)
     entry_id = Column(Integer, ForeignKey("entries.id"), index=True)
     definition = Column(String, nullable=True, index=True)
+    # earlier definitions are the more common meanings of the entry
+    position = Column(Integer, nullable=True)
 
     entry = relationship("Entry", back_populates="definitions")
 
@@ -0,0 +1,99 @@
+import collections
+
+from sqlalchemy.orm import Session
+
+import backend.app.models as models
+from backend.app import lookups, search
+from backend.app.database import SessionLocal
+
+# Simplified and traditional characters are folded into one script for searching.
+# The character mapping is derived from the dictionary's traditional/simplified
+# pairs: a traditional character maps to the simplified character it corresponds
+# to most often. Sentences and entries store their normalized text in indexed
+# columns, so only the keyword has to be converted when searching.
+# Usage: python -m backend.app.normalization (to rebuild it, e.g., after the dictionary changes)
+
+UPDATE_BATCH_SIZE = 5000
+
+
+def build_character_map(pairs) -> dict[str, str]:
+    """Map traditional characters to their most frequent simplified counterpart"""
+    counts = collections.defaultdict(collections.Counter)
+    for traditional, simplified in pairs:
+        if not traditional or not simplified or len(traditional) != len(simplified):
+            continue  # the characters can't be lined up
+        for t, s in zip(traditional, simplified):
+            if t != s:
+                counts[t][s] += 1
+
+    # ties go to the lowest code point so that the mapping is reproducible
+    return {
+        t: min(candidates, key=lambda s: (-candidates[s], s))
+        for t, candidates in counts.items()
+    }
+
+
+def normalize_script(text: str, table: dict[int, str]) -> str:
+    """Convert text to simplified characters with a table from lookups.get_script_table"""
+    return text.translate(table)
+
+
+def populate_character_mappings(db: Session) -> dict[str, str]:
+    """Derive the character mapping from the dictionary and store it"""
+    rows = db.query(models.Entry.traditional, models.Entry.simplified).all()
+    char_map = build_character_map(rows)
+
+    db.query(models.CharacterMapping).delete()
+    db.bulk_save_objects(
+        [
+            models.CharacterMapping(traditional=t, simplified=s)
+            for t, s in sorted(char_map.items())
+        ]
+    )
+    db.commit()
+
+    lookups.reload_script_table(db)
+    return char_map
+
+
+def _normalize_column(db: Session, model, text_column, normalized_column):
+    table = lookups.get_script_table(db)
+    last_id = 0
+    while rows := (
+        db.query(model.id, text_column)
+        .filter(model.id > last_id)
+        .order_by(model.id)
+        .limit(UPDATE_BATCH_SIZE)
+        .all()
+    ):
+        db.bulk_update_mappings(
+            model,
+            [
+                {"id": row_id, normalized_column.key: normalize_script(text or "", table)}
+                for row_id, text in rows
+            ],
+        )
+        last_id = rows[-1][0]
+    db.commit()
+
+
+def normalize_entries(db: Session):
+    _normalize_column(db, models.Entry, models.Entry.simplified, models.Entry.normalized)
+    lookups.reload_position_index(db)
+
+
+def normalize_sentences(db: Session):
+    _normalize_column(
+        db, models.Sentence, models.Sentence.text, models.Sentence.text_normalized
+    )
+
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        char_map = populate_character_mappings(db)
+        normalize_entries(db)
+        normalize_sentences(db)
+        search.create_sentence_index(db.connection())
+        db.commit()
+        lookups.bump_data_version(db, "dictionary")
+    print(f"Normalized with {len(char_map)} character mappings")
@@ -0,0 +1,44 @@
+import base64
+import binascii
+import json
+
+# Keyset pagination: instead of skipping `offset` rows, every page continues after
+# the sort key of the last row of the previous one, which an index can seek to directly.
+# The cursor is opaque to clients so that its contents can change later.
+
+
+def encode_cursor(**keys) -> str:
+    payload = json.dumps(keys, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *keys: str) -> dict:
+    """Get the sort keys to continue after (empty for the first page, i.e. an empty cursor)"""
+    if not cursor:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid cursor")
+
+    # e.g., a cursor from a differently sorted listing
+    if not isinstance(payload, dict) or set(payload) != set(keys):
+        raise ValueError("Invalid cursor")
+    if not isinstance(payload.get("id"), int):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def make_page(rows: list, limit: int, keys: tuple[str, ...] = ("id",)) -> dict:
+    """Build a page from up to limit + 1 rows (the extra row means there is a next page)
+
+    The rows can be objects with the sort keys as attributes or dicts.
+    """
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        if not isinstance(last, dict):
+            last = {key: getattr(last, key) for key in keys}
+        next_cursor = encode_cursor(**{key: last[key] for key in keys})
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,152 @@
+import bisect
+import itertools
+import re
+from array import array
+
+from backend.app.helpers import (
+    is_chinese_script,
+    normalize_pinyin,
+    parse_pinyin,
+    strip_tones,
+)
+
+# Search for keywords that mix characters and pinyin e.g., "好kan" or "ni好"
+# Every position of an entry is indexed by its character and by its syllable (with
+# and without the tone), each key pointing to the sorted ids of the entries that
+# have it at that position. A keyword is split into one token per character or
+# syllable, and the entries starting with those tokens are the intersection of
+# their posting lists, which is computed from the smallest list up. The keyword may
+# end in the middle of a syllable while it's typed (e.g., "积le" for 积累 ji1 lei3),
+# so the last syllable matches every key at its position that starts with it, which
+# are found by a binary search over the sorted syllables of that position.
+# Searches for characters anywhere in an entry use the same postings, intersected
+# once for each position the characters could start at.
+
+SEPARATOR_REGEX = re.compile(r"[\s']+")
+
+
+def is_mixed_query(keyword: str) -> bool:
+    """Whether the keyword has both characters and (latin) pinyin"""
+    return is_chinese_script(keyword) and any(
+        char.isascii() and char.isalpha() for char in keyword
+    )
+
+
+def tokenize_query(keyword: str) -> list[str] | None:
+    """Split a keyword into characters and syllables e.g., "好Kan4" -> ["好", "kan4"]
+
+    The end of the keyword may be the start of a syllable e.g., "好k" -> ["好", "k"].
+    Returns None if some of the rest of the keyword isn't pinyin.
+    """
+    tokens = []
+    runs = [
+        (is_chinese, list(run))
+        for is_chinese, run in itertools.groupby(keyword, is_chinese_script)
+    ]
+    for i, (is_chinese, run) in enumerate(runs):
+        if is_chinese:
+            tokens += run
+            continue
+
+        run = SEPARATOR_REGEX.sub("", normalize_pinyin("".join(run)))
+        syllables = [normalize_pinyin(syllable) for syllable in parse_pinyin(run)]
+        rest = run[len("".join(syllables)):]
+        if not run.startswith("".join(syllables)) or (rest and i < len(runs) - 1):
+            return None  # e.g., "k好", where "k" isn't a (full) syllable
+        tokens += syllables + ([rest] if rest else [])
+    return tokens
+
+
+def gallop(ids: array, target: int, lo: int) -> int:
+    """Find where target is (or would be) in ids[lo:], looking exponentially further"""
+    step = 1
+    while lo + step < len(ids) and ids[lo + step] < target:
+        step *= 2
+    return bisect.bisect_left(ids, target, lo + step // 2, min(lo + step + 1, len(ids)))
+
+
+def intersect(posting_lists: list[array]) -> list[int]:
+    """Intersect sorted posting lists, starting with the smallest"""
+    if not posting_lists:
+        return []
+
+    posting_lists = sorted(posting_lists, key=len)
+    result = list(posting_lists[0])
+    for ids in posting_lists[1:]:
+        matched = []
+        i = 0
+        for entry_id in result:
+            i = gallop(ids, entry_id, i)
+            if i == len(ids):
+                break
+            if ids[i] == entry_id:
+                matched.append(entry_id)
+        result = matched
+        if not result:
+            break
+    return result
+
+
+class PositionIndex:
+    """Ids of the entries with each character/syllable at each position"""
+
+    def __init__(self, postings: dict[tuple[int, str], array]):
+        self.postings = postings
+        self.length = max((position + 1 for position, _ in postings), default=0)
+        # the sorted syllables at each position, to look up the ones with a prefix
+        self.syllables = {}
+        for position, key in postings:
+            if not is_chinese_script(key):
+                self.syllables.setdefault(position, []).append(key)
+        for keys in self.syllables.values():
+            keys.sort()
+
+    @classmethod
+    def from_entries(cls, rows):
+        """Build the index from (id, normalized, toned pinyin) rows"""
+        postings = {}
+        for entry_id, normalized, pinyin_toned in sorted(rows):
+            keys = set(enumerate(normalized or ""))
+            for i, syllable in enumerate((pinyin_toned or "").split()):
+                keys.add((i, syllable))
+                keys.add((i, strip_tones(syllable)))
+            # ids are visited in order, so every posting list is already sorted
+            for key in keys:
+                postings.setdefault(key, array("i")).append(entry_id)
+        return cls(postings)
+
+    def prefix_postings(self, position: int, prefix: str) -> array | None:
+        """Get the sorted ids of the entries with a syllable starting with prefix at position"""
+        keys = self.syllables.get(position, [])
+        i = bisect.bisect_left(keys, prefix)
+        matched = set()
+        while i < len(keys) and keys[i].startswith(prefix):
+            matched.update(self.postings[(position, keys[i])])
+            i += 1
+        return array("i", sorted(matched)) if matched else None
+
+    def search(self, tokens: list[str], prefix: bool = False) -> list[int]:
+        """Get the sorted ids of the entries starting with the tokens
+
+        If prefix is set, the last token only has to be the start of a syllable.
+        """
+        posting_lists = []
+        for i, token in enumerate(tokens):
+            if prefix and i == len(tokens) - 1:
+                ids = self.prefix_postings(i, token)
+            else:
+                # a toneless syllable matches any tone, like the other pinyin searches
+                ids = self.postings.get((i, token))
+            if ids is None:
+                return []
+            posting_lists.append(ids)
+        return intersect(posting_lists)
+
+    def search_anywhere(self, tokens: list[str]) -> list[int]:
+        """Get the sorted ids of the entries with the tokens in a row at any position"""
+        entry_ids = set()
+        for start in range(self.length - len(tokens) + 1):
+            posting_lists = [self.postings.get((start + i, token)) for i, token in enumerate(tokens)]
+            if all(ids is not None for ids in posting_lists):
+                entry_ids.update(intersect(posting_lists))
+        return sorted(entry_ids)
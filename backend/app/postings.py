@@ -0,0 +1,88 @@
+import zlib
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import backend.app.models as models
+from backend.app import executors, segmenter
+from backend.app.database import SessionLocal
+
+# Inverted index from word -> ids of the sentences that contain it
+# Every sentence is segmented once (offline, with jieba's precise mode), so a word
+# only matches sentences where it is a whole word, unlike a substring search.
+# Each posting list is stored as the deltas between consecutive (sorted) ids,
+# which are small numbers that compress well.
+# Usage: python -m backend.app.postings
+
+POSTINGS_DTYPE = np.uint32
+BUILD_BATCH_SIZE = 5000
+
+
+def encode_postings(sentence_ids) -> bytes:
+    ids = np.unique(np.asarray(sentence_ids, dtype=POSTINGS_DTYPE))  # sorted
+    deltas = np.diff(ids, prepend=POSTINGS_DTYPE(0))
+    return zlib.compress(deltas.astype(POSTINGS_DTYPE).tobytes())
+
+
+def decode_postings(data: bytes) -> np.ndarray:
+    deltas = np.frombuffer(zlib.decompress(data), dtype=POSTINGS_DTYPE)
+    return np.cumsum(deltas, dtype=np.int64)
+
+
+def sentence_words(text: str) -> set[str]:
+    """Get the distinct words of a sentence (runs in the segmentation pool)"""
+    return set(segmenter.ENGINES["jieba"].cut(text))
+
+
+def build_postings(db: Session) -> int:
+    """Segment every sentence and replace the stored posting lists"""
+    postings = {}
+    last_id = 0
+    while True:
+        rows = (
+            db.query(models.Sentence.id, models.Sentence.text)
+            .filter(models.Sentence.id > last_id)
+            .order_by(models.Sentence.id)
+            .limit(BUILD_BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+
+        words = executors.map_segmentation(sentence_words, [text for _, text in rows])
+        # ids are visited in order, so every posting list is already sorted
+        for (sentence_id, _), sentence in zip(rows, words):
+            for word in sentence:
+                postings.setdefault(word, []).append(sentence_id)
+        last_id = rows[-1][0]
+
+    db.query(models.SentencePosting).delete()
+    db.bulk_save_objects(
+        [
+            models.SentencePosting(
+                word=word, sentence_count=len(ids), sentence_ids=encode_postings(ids)
+            )
+            for word, ids in postings.items()
+        ]
+    )
+    db.commit()
+    return len(postings)
+
+
+def get_sentence_ids(db: Session, words: list[str]) -> np.ndarray:
+    """Get the sorted ids of the sentences that contain any of the words"""
+    rows = (
+        db.query(models.SentencePosting.sentence_ids)
+        .filter(models.SentencePosting.word.in_(set(words)))
+        .all()
+    )
+    if not rows:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate([decode_postings(data) for data, in rows]))
+
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        count = build_postings(db)
+    executors.shutdown_segmentation_pool()
+    print(f"Stored posting lists for {count} words")
@@ -20,6 +20,11 @@ class Sentence(BaseModel):
     text: str
 
 
+class SentencePage(BaseModel):
+    items: list[Sentence]
+    next_cursor: str | None
+
+
 class PronunciationBase(BaseModel):
     pinyin: str
     position: int
@@ -37,6 +42,18 @@ class Entry(BaseModel):
     definitions: list[DefinitionBase]
 
 
+class EntrySuggestion(BaseModel):
+    id: int
+    simplified: str
+    traditional: str
+    pinyin: str | None
+
+
+class EntryPage(BaseModel):
+    items: list[Entry]
+    next_cursor: str | None
+
+
 class WordBase(BaseModel):
     simplified: str
     traditional: str
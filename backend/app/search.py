@@ -0,0 +1,255 @@
+import re
+
+from sqlalchemy import Connection, column, func, inspect, literal_column, table, text
+from sqlalchemy.orm import Session
+
+import backend.app.models as models
+
+# Full-text indexes for searching sentences by keyword and definitions by English words
+# A LIKE '%keyword%' filter can't use a regular index, so it reads every sentence.
+# SQLite uses an FTS5 table with the trigram tokenizer instead, which is kept in
+# sync with the sentences table by triggers. Postgres uses a pg_trgm GIN index.
+# Both are created by a migration (and by the loader for databases created without one).
+# The script-normalized text is indexed, so the keyword has to be normalized as well.
+# Definitions are indexed by (stemmed) English words instead: an FTS5 table with the
+# porter tokenizer on SQLite, and a GIN index over an english tsvector on Postgres.
+
+SENTENCE_INDEX = "sentences_fts"
+POSTGRES_SENTENCE_INDEX = "ix_sentences_text_normalized_trgm"
+
+# the trigram index can only find keywords of at least three characters
+MIN_KEYWORD_LENGTH = 3
+
+SQLITE_SENTENCE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SENTENCE_INDEX}
+    USING fts5(
+        text_normalized, content='sentences', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sentences_fts_insert AFTER INSERT ON sentences BEGIN
+        INSERT INTO {SENTENCE_INDEX}(rowid, text_normalized)
+        VALUES (new.id, new.text_normalized);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sentences_fts_delete AFTER DELETE ON sentences BEGIN
+        INSERT INTO {SENTENCE_INDEX}({SENTENCE_INDEX}, rowid, text_normalized)
+        VALUES ('delete', old.id, old.text_normalized);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sentences_fts_update AFTER UPDATE ON sentences BEGIN
+        INSERT INTO {SENTENCE_INDEX}({SENTENCE_INDEX}, rowid, text_normalized)
+        VALUES ('delete', old.id, old.text_normalized);
+        INSERT INTO {SENTENCE_INDEX}(rowid, text_normalized)
+        VALUES (new.id, new.text_normalized);
+    END
+    """,
+]
+
+SQLITE_SENTENCE_DROP = [
+    "DROP TRIGGER IF EXISTS sentences_fts_insert",
+    "DROP TRIGGER IF EXISTS sentences_fts_delete",
+    "DROP TRIGGER IF EXISTS sentences_fts_update",
+    f"DROP TABLE IF EXISTS {SENTENCE_INDEX}",
+]
+
+POSTGRES_SENTENCE_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""
+    CREATE INDEX IF NOT EXISTS {POSTGRES_SENTENCE_INDEX}
+    ON sentences USING gin (text_normalized gin_trgm_ops)
+    """,
+]
+
+POSTGRES_SENTENCE_DROP = [f"DROP INDEX IF EXISTS {POSTGRES_SENTENCE_INDEX}"]
+
+DEFINITION_INDEX = "definitions_fts"
+POSTGRES_DEFINITION_INDEX = "ix_definitions_definition_tsv"
+# the text search configuration for stemming, e.g., "studies" matches "to study"
+POSTGRES_LANGUAGE = "english"
+
+SQLITE_DEFINITION_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {DEFINITION_INDEX}
+    USING fts5(
+        definition, content='definitions', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS definitions_fts_insert AFTER INSERT ON definitions BEGIN
+        INSERT INTO {DEFINITION_INDEX}(rowid, definition) VALUES (new.id, new.definition);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS definitions_fts_delete AFTER DELETE ON definitions BEGIN
+        INSERT INTO {DEFINITION_INDEX}({DEFINITION_INDEX}, rowid, definition)
+        VALUES ('delete', old.id, old.definition);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS definitions_fts_update AFTER UPDATE ON definitions BEGIN
+        INSERT INTO {DEFINITION_INDEX}({DEFINITION_INDEX}, rowid, definition)
+        VALUES ('delete', old.id, old.definition);
+        INSERT INTO {DEFINITION_INDEX}(rowid, definition) VALUES (new.id, new.definition);
+    END
+    """,
+]
+
+SQLITE_DEFINITION_DROP = [
+    "DROP TRIGGER IF EXISTS definitions_fts_insert",
+    "DROP TRIGGER IF EXISTS definitions_fts_delete",
+    "DROP TRIGGER IF EXISTS definitions_fts_update",
+    f"DROP TABLE IF EXISTS {DEFINITION_INDEX}",
+]
+
+POSTGRES_DEFINITION_CREATE = [
+    f"""
+    CREATE INDEX IF NOT EXISTS {POSTGRES_DEFINITION_INDEX}
+    ON definitions USING gin (to_tsvector('{POSTGRES_LANGUAGE}', definition))
+    """,
+]
+
+POSTGRES_DEFINITION_DROP = [f"DROP INDEX IF EXISTS {POSTGRES_DEFINITION_INDEX}"]
+
+# words and "quoted phrases" in an English query
+TERM_REGEX = re.compile(r'"([^"]*)"|(\S+)')
+
+# whether each database has the index, so that it is only checked once
+_index_available = {}
+
+
+def _execute_all(connection: Connection, statements: list[str]):
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def create_sentence_index(connection: Connection):
+    """(Re)create the full-text index for sentences and fill it with the existing ones"""
+    drop_sentence_index(connection)
+    if connection.dialect.name == "sqlite":
+        _execute_all(connection, SQLITE_SENTENCE_CREATE)
+        # index the sentences that were inserted before the table existed
+        connection.execute(
+            text(f"INSERT INTO {SENTENCE_INDEX}({SENTENCE_INDEX}) VALUES ('rebuild')")
+        )
+    elif connection.dialect.name == "postgresql":
+        _execute_all(connection, POSTGRES_SENTENCE_CREATE)
+    _index_available.clear()
+
+
+def drop_sentence_index(connection: Connection):
+    if connection.dialect.name == "sqlite":
+        _execute_all(connection, SQLITE_SENTENCE_DROP)
+    elif connection.dialect.name == "postgresql":
+        _execute_all(connection, POSTGRES_SENTENCE_DROP)
+    _index_available.clear()
+
+
+def create_definition_index(connection: Connection):
+    """(Re)create the full-text index for definitions and fill it with the existing ones"""
+    drop_definition_index(connection)
+    if connection.dialect.name == "sqlite":
+        _execute_all(connection, SQLITE_DEFINITION_CREATE)
+        connection.execute(
+            text(f"INSERT INTO {DEFINITION_INDEX}({DEFINITION_INDEX}) VALUES ('rebuild')")
+        )
+    elif connection.dialect.name == "postgresql":
+        _execute_all(connection, POSTGRES_DEFINITION_CREATE)
+    _index_available.clear()
+
+
+def drop_definition_index(connection: Connection):
+    if connection.dialect.name == "sqlite":
+        _execute_all(connection, SQLITE_DEFINITION_DROP)
+    elif connection.dialect.name == "postgresql":
+        _execute_all(connection, POSTGRES_DEFINITION_DROP)
+    _index_available.clear()
+
+
+def _has_index(db: Session, sqlite_table: str, table_name: str, postgres_index: str) -> bool:
+    bind = db.get_bind()
+    key = (str(bind.engine.url), sqlite_table)
+    if key not in _index_available:
+        inspector = inspect(bind)
+        if bind.dialect.name == "sqlite":
+            _index_available[key] = inspector.has_table(sqlite_table)
+        elif bind.dialect.name == "postgresql":
+            indexes = inspector.get_indexes(table_name)
+            _index_available[key] = any(i["name"] == postgres_index for i in indexes)
+        else:
+            _index_available[key] = False
+    return _index_available[key]
+
+
+def has_sentence_index(db: Session) -> bool:
+    return _has_index(db, SENTENCE_INDEX, "sentences", POSTGRES_SENTENCE_INDEX)
+
+
+def has_definition_index(db: Session) -> bool:
+    return _has_index(db, DEFINITION_INDEX, "definitions", POSTGRES_DEFINITION_INDEX)
+
+
+def match_sentences(db: Session, query, keyword: str):
+    """Restrict a query of sentences to the ones containing the (normalized) keyword.
+
+    Returns the filtered query and the columns to order it by relevance, or None if
+    the index can't be used for the keyword, so that the caller can fall back to
+    scanning the sentences.
+    """
+    if len(keyword) < MIN_KEYWORD_LENGTH or not has_sentence_index(db):
+        return None
+
+    if db.get_bind().dialect.name == "sqlite":
+        index = table(SENTENCE_INDEX, column("rowid"))
+        # a quoted phrase, so that the keyword isn't parsed as a query
+        phrase = '"' + keyword.replace('"', '""') + '"'
+        query = (
+            query.join(index, index.c.rowid == models.Sentence.id)
+            .filter(text(f"{SENTENCE_INDEX} MATCH :phrase"))
+            .params(phrase=phrase)
+        )
+        return query, [func.bm25(literal_column(SENTENCE_INDEX)), models.Sentence.id]
+
+    # the GIN index is used for the LIKE filter, similarity ranks the matches
+    query = query.filter(models.Sentence.text_normalized.contains(keyword, autoescape=True))
+    relevance = func.similarity(models.Sentence.text_normalized, keyword).desc()
+    return query, [relevance, models.Sentence.id]
+
+
+def definition_terms(english: str) -> list[str]:
+    """Split an English query into words and phrases e.g., 'to "look after"'"""
+    terms = (phrase or word for phrase, word in TERM_REGEX.findall(english))
+    # ignore terms without any letters or digits, e.g., a lone "-"
+    return [term for term in terms if any(char.isalnum() for char in term)]
+
+
+def match_definitions(db: Session, query, terms: list[str]):
+    """Restrict a query of definitions to the ones containing all the terms
+
+    Returns the filtered query and a relevance to order it by (lower is better),
+    or None if there is no index, so that the caller can fall back to scanning
+    the definitions.
+    """
+    if not has_definition_index(db):
+        return None
+
+    if db.get_bind().dialect.name == "sqlite":
+        index = table(DEFINITION_INDEX, column("rowid"))
+        # every term as a quoted phrase, so that they aren't parsed as operators
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        query = query.join(index, index.c.rowid == models.Definition.id).filter(
+            text(f"{DEFINITION_INDEX} MATCH :match").bindparams(match=match)
+        )
+        return query, func.bm25(literal_column(DEFINITION_INDEX))
+
+    # websearch_to_tsquery treats quoted terms as phrases
+    match = " ".join(f'"{term}"' if " " in term else term for term in terms)
+    # the same expression as the index (with the configuration inlined), so it's used
+    language = literal_column(f"'{POSTGRES_LANGUAGE}'::regconfig")
+    document = func.to_tsvector(language, models.Definition.definition)
+    tsquery = func.websearch_to_tsquery(language, match)
+    query = query.filter(document.op("@@")(tsquery))
+    return query, -func.ts_rank(document, tsquery)
@@ -0,0 +1,234 @@
+import functools
+import hashlib
+import marshal
+import os
+import re
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterator, Literal
+
+import jieba
+
+from backend.app.shared_table import SharedTable, write_table
+
+# Building jieba's prefix dictionary from dict.txt.big takes a few seconds, so it is
+# built once (python -m backend.app.segmenter) and saved as a marshal file.
+# The file name contains the hash of the dictionary, so a changed dictionary
+# never loads a stale prefix dictionary.
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DICTIONARY_FILE = os.path.join(BASE_DIR, "resources", "dict.txt.big")
+ARTIFACT_DIR = os.getenv("SEGMENTER_ARTIFACT_DIR", os.path.join(BASE_DIR, "resources"))
+
+# With several uvicorn workers, each one would hold its own copy of the prefix
+# dictionary. In shared memory mode, the dictionary is memory-mapped from a file
+# instead, so every worker shares the same pages. Every lookup then hashes and
+# decodes the key instead of using a dict, which makes segmentation roughly twice
+# as slow (same results), so it's only worth it when memory is the constraint.
+SHARED_MEMORY = os.getenv("SEGMENTER_SHARED_MEMORY", "false").lower() == "true"
+
+_lock = threading.Lock()
+_ready = threading.Event()
+
+
+def dictionary_hash(dictionary_file: str = DICTIONARY_FILE) -> str:
+    digest = hashlib.sha256()
+    with open(dictionary_file, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+@functools.cache
+def jieba_version() -> str:
+    """Get the hash of the dictionary that jieba uses (computed once per process)"""
+    return dictionary_hash()
+
+
+def artifact_path(dictionary_file: str = DICTIONARY_FILE) -> str:
+    return os.path.join(ARTIFACT_DIR, f"jieba.{dictionary_hash(dictionary_file)}.cache")
+
+
+def shared_table_path(dictionary_file: str = DICTIONARY_FILE) -> str:
+    return os.path.join(ARTIFACT_DIR, f"jieba.{dictionary_hash(dictionary_file)}.table")
+
+
+def build_artifact(dictionary_file: str = DICTIONARY_FILE) -> str:
+    """Build the prefix dictionary and save it in ARTIFACT_DIR"""
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    with open(dictionary_file, "rb") as f:
+        freq, total = jieba.Tokenizer.gen_pfdict(f)
+
+    # the memory-mapped version for shared memory mode
+    write_table(shared_table_path(dictionary_file), freq.items(), extra=total)
+
+    path = artifact_path(dictionary_file)
+
+    # write to a temporary file first so that workers never load a partial file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        marshal.dump((freq, total), f)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+    return path
+
+
+def load_artifact(dictionary_file: str = DICTIONARY_FILE) -> bool:
+    """Load the prebuilt prefix dictionary into jieba if it exists"""
+    if SHARED_MEMORY and os.path.isfile(path := shared_table_path(dictionary_file)):
+        freq = SharedTable(path)
+        total = freq.extra
+    elif os.path.isfile(path := artifact_path(dictionary_file)):
+        with open(path, "rb") as f:
+            freq, total = marshal.load(f)
+    else:
+        return False
+
+    with jieba.dt.lock:
+        jieba.dt.FREQ, jieba.dt.total = freq, total
+        jieba.dt.initialized = True
+
+    return True
+
+
+def initialize(dictionary_file: str = DICTIONARY_FILE):
+    """Initialize jieba, preferring the prebuilt prefix dictionary"""
+    if _ready.is_set():
+        return
+
+    with _lock:
+        if _ready.is_set():  # initialized by another thread in the meantime
+            return
+
+        jieba.setLogLevel(20)  # don't print initialization information
+        jieba.set_dictionary(dictionary_file)
+        if not load_artifact(dictionary_file):
+            jieba.initialize()  # fall back to building it from the text file
+
+        _ready.set()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+# Segmentation engines that can be selected per request
+SegmentationMode = Literal["jieba-full", "jieba", "trie"]
+DEFAULT_MODE = "jieba-full"
+
+
+class SegmentationEngine(ABC):
+    """Splits text into words, skipping punctuation and whitespace"""
+
+    name: str
+    # identifies the dictionary the engine segments with (e.g., for cache keys)
+    version: str = ""
+
+    @abstractmethod
+    def cut(self, text: str) -> Iterator[str]:
+        """Yield the words of the text"""
+
+
+class JiebaEngine(SegmentationEngine):
+    """jieba in full mode (every candidate word) or precise mode"""
+
+    def __init__(self, name: str, cut_all: bool):
+        self.name = name
+        self.cut_all = cut_all
+
+    @property
+    def version(self) -> str:
+        return jieba_version()
+
+    def cut(self, text: str) -> Iterator[str]:
+        initialize()  # no-op once the dictionary is loaded
+        yield from filter(lambda w: w.isalnum(), jieba.cut(text, cut_all=self.cut_all))
+
+
+# runs of hanzi are matched against the dictionary, other words are kept as is
+TRIE_TOKEN_REGEX = re.compile(r"([\u3400-\u4dbf\u4e00-\u9fff]+)|([^\W_]+)")
+
+
+class TrieEngine(SegmentationEngine):
+    """Bidirectional maximum matching against a set of dictionary words.
+
+    The trie is flattened into two dicts: every prefix of a word maps to whether
+    that prefix is a word itself, and the same for every suffix. Matching walks
+    forward (or backward) until the fragment isn't a prefix (or suffix) of any
+    word, so each position only costs a few dict lookups.
+    """
+
+    name = "trie"
+
+    def __init__(self, words, version: str = ""):
+        self.version = version
+        self.prefixes = {}
+        self.suffixes = {}
+        for word in words:
+            for i in range(1, len(word) + 1):
+                self.prefixes[word[:i]] = self.prefixes.get(word[:i], False) or i == len(word)
+                suffix = word[-i:]
+                self.suffixes[suffix] = self.suffixes.get(suffix, False) or i == len(word)
+
+    def forward_match(self, text: str) -> list[str]:
+        prefixes = self.prefixes
+        words = []
+        i, n = 0, len(text)
+        while i < n:
+            end = i + 1  # unknown characters are words on their own
+            j = i + 1
+            while j <= n and (is_word := prefixes.get(text[i:j])) is not None:
+                if is_word:
+                    end = j
+                j += 1
+            words.append(text[i:end])
+            i = end
+        return words
+
+    def backward_match(self, text: str) -> list[str]:
+        suffixes = self.suffixes
+        words = []
+        i = len(text)
+        while i > 0:
+            start = i - 1
+            j = i - 1
+            while j >= 0 and (is_word := suffixes.get(text[j:i])) is not None:
+                if is_word:
+                    start = j
+                j -= 1
+            words.append(text[start:i])
+            i = start
+        words.reverse()
+        return words
+
+    def match(self, text: str) -> list[str]:
+        forward = self.forward_match(text)
+        backward = self.backward_match(text)
+
+        # prefer fewer words, then fewer single characters, then backward matching
+        # (which tends to be more accurate for Chinese)
+        if len(forward) != len(backward):
+            return forward if len(forward) < len(backward) else backward
+        forward_singles = sum(len(w) == 1 for w in forward)
+        backward_singles = sum(len(w) == 1 for w in backward)
+        return forward if forward_singles < backward_singles else backward
+
+    def cut(self, text: str) -> Iterator[str]:
+        for hanzi, other in TRIE_TOKEN_REGEX.findall(text):
+            if hanzi:
+                yield from self.match(hanzi)
+            else:
+                yield other
+
+
+ENGINES = {
+    "jieba-full": JiebaEngine("jieba-full", cut_all=True),
+    "jieba": JiebaEngine("jieba", cut_all=False),
+}
+
+
+if __name__ == "__main__":
+    print(f"Prefix dictionary saved to {build_artifact()}")
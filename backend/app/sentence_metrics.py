@@ -0,0 +1,91 @@
+import math
+
+from sqlalchemy.orm import Session
+
+import backend.app.models as models
+from backend.app import executors, lookups, segmenter
+from backend.app.database import SessionLocal
+from backend.app.helpers import is_chinese_script
+
+# Difficulty metrics for every sentence, computed once so that sentences can be
+# filtered and sorted by difficulty with indexes instead of analyzing them per request.
+# Only Chinese words are counted (not numbers or latin words), and the normalized
+# text is segmented since the HSK lists are in simplified characters.
+# Usage: python -m backend.app.sentence_metrics
+
+# words outside the HSK lists count as one level above the highest one
+UNKNOWN_LEVEL = 7
+
+# longer sentences are harder, but much less so than harder words
+LENGTH_WEIGHT = 0.25
+
+UPDATE_BATCH_SIZE = 5000
+
+
+def sentence_tokens(text: str) -> list[str]:
+    """Get the Chinese words of a sentence (runs in the segmentation pool)"""
+    return [word for word in segmenter.ENGINES["jieba"].cut(text) if is_chinese_script(word)]
+
+
+def compute_metrics(words: list[str], hsk_lookup) -> dict:
+    levels = [hsk_lookup.get(word) or UNKNOWN_LEVEL for word in words]
+    token_count = len(levels)
+
+    # e.g., sentences in another language, which aren't useful for any level
+    if not token_count:
+        return {
+            "token_count": 0,
+            "max_hsk_level": None,
+            "unknown_ratio": None,
+            "difficulty": None,
+        }
+
+    known = [level for level in levels if level != UNKNOWN_LEVEL]
+    unknown_ratio = (token_count - len(known)) / token_count
+    # average word level plus a little for every doubling of the length
+    difficulty = sum(levels) / token_count + LENGTH_WEIGHT * math.log2(token_count)
+
+    # rounded so that the values survive a round trip through a cursor unchanged
+    return {
+        "token_count": token_count,
+        # a sentence without any HSK word is as hard as its unknown words
+        "max_hsk_level": max(known, default=UNKNOWN_LEVEL),
+        "unknown_ratio": round(unknown_ratio, 4),
+        "difficulty": round(difficulty, 4),
+    }
+
+
+def update_sentence_metrics(db: Session) -> int:
+    """Compute and store the metrics of every sentence"""
+    hsk_lookup = lookups.get_hsk_lookup(db)
+    updated = 0
+    last_id = 0
+    while rows := (
+        db.query(models.Sentence.id, models.Sentence.text, models.Sentence.text_normalized)
+        .filter(models.Sentence.id > last_id)
+        .order_by(models.Sentence.id)
+        .limit(UPDATE_BATCH_SIZE)
+        .all()
+    ):
+        texts = [text_normalized or text for _, text, text_normalized in rows]
+        tokens = executors.map_segmentation(sentence_tokens, texts)
+        db.bulk_update_mappings(
+            models.Sentence,
+            [
+                {"id": sentence_id, **compute_metrics(words, hsk_lookup)}
+                for (sentence_id, _, _), words in zip(rows, tokens)
+            ],
+        )
+        updated += len(rows)
+        last_id = rows[-1][0]
+
+    db.commit()
+    lookups.reload_sentence_sort_keys(db)
+    return updated
+
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        count = update_sentence_metrics(db)
+    executors.shutdown_segmentation_pool()
+    print(f"Updated the metrics of {count} sentences")
@@ -0,0 +1,111 @@
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from collections.abc import Mapping
+
+# Read-only str -> int hash table stored in a single file that is memory-mapped.
+# Every process that maps the same file shares its pages through the OS page cache,
+# so N workers only need one copy instead of N separate Python dicts.
+#
+# Layout (little endian):
+#   header  magic, slot count, item count, keys size, extra value
+#   slots   (key offset + 1, key length, value) per slot; offset 0 marks an empty slot
+#   keys    UTF-8 encoded keys, one after the other
+#
+# Slots use open addressing with linear probing, hashed with crc32 since
+# Python's hash() is randomized per process.
+
+MAGIC = b"LTST0001"
+HEADER = struct.Struct("<8sQQQq")
+SLOT = struct.Struct("<IIq")
+
+
+def _slot_count(items: int) -> int:
+    # keep the load factor at or below 0.5 so that probes stay short
+    count = 1
+    while count < items * 2:
+        count *= 2
+    return count
+
+
+def write_table(path: str, items, extra: int = 0):
+    """Write a mapping of str -> int to path (extra is stored in the header)"""
+    items = [(key.encode(), value) for key, value in items]
+    slot_count = _slot_count(len(items))
+    mask = slot_count - 1
+
+    slots = bytearray(slot_count * SLOT.size)
+    keys = bytearray()
+    for key, value in items:
+        i = zlib.crc32(key) & mask
+        while SLOT.unpack_from(slots, i * SLOT.size)[0]:
+            i = (i + 1) & mask
+        SLOT.pack_into(slots, i * SLOT.size, len(keys) + 1, len(key), value)
+        keys += key
+
+    # write to a temporary file first so that nobody maps a partial file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(HEADER.pack(MAGIC, slot_count, len(items), len(keys), extra))
+        f.write(slots)
+        f.write(keys)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+class SharedTable(Mapping):
+    """Memory-mapped, read-only mapping of str -> int created by write_table
+
+    Lookups are several times slower than with a dict, since every one encodes the
+    key and probes the slots with struct.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, slot_count, self._len, _, self.extra = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a shared table")
+
+        self._mask = slot_count - 1
+        self._slots_start = HEADER.size
+        self._keys_start = HEADER.size + slot_count * SLOT.size
+
+    def _find(self, key: bytes):
+        mm = self._mm
+        i = zlib.crc32(key) & self._mask
+        while True:
+            offset, length, value = SLOT.unpack_from(mm, self._slots_start + i * SLOT.size)
+            if not offset:
+                return None
+            if length == len(key):
+                start = self._keys_start + offset - 1
+                if mm[start:start + length] == key:
+                    return value
+            i = (i + 1) & self._mask
+
+    def __getitem__(self, key):
+        value = self._find(key.encode()) if isinstance(key, str) else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._find(key.encode())
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self._find(key.encode()) is not None
+
+    def __iter__(self):
+        for i in range(self._mask + 1):
+            offset, length, _ = SLOT.unpack_from(self._mm, self._slots_start + i * SLOT.size)
+            if offset:
+                start = self._keys_start + offset - 1
+                yield self._mm[start:start + length].decode()
+
+    def __len__(self):
+        return self._len
@@ -0,0 +1,95 @@
+import bisect
+import re
+from array import array
+
+from backend.app.helpers import PINYIN_TONES, normalize_pinyin, strip_tones
+
+# Type-ahead suggestions for the dictionary
+# Every entry is reachable through a few search keys: its simplified and traditional
+# forms, and its pinyin with and without tones (without spaces, so that "ji lei",
+# "jilei" and "ji1lei3" all work). The keys are kept in one sorted list, so that
+# all keys starting with a prefix are next to each other and can be found with a
+# binary search instead of a database query per keystroke.
+
+PINYIN_SEPARATOR_REGEX = re.compile(r"[\s']+")
+
+
+def pinyin_key(pinyin: str) -> str:
+    """Normalize pinyin into a search key e.g., "Ji1 lei3" -> "ji1lei3" """
+    return PINYIN_SEPARATOR_REGEX.sub("", normalize_pinyin(pinyin))
+
+
+def partial_tones_regex(prefix: str) -> re.Pattern:
+    """Match toned keys against a prefix with only some tones e.g., "jilei3" """
+    # syllable boundaries aren't known, so any letter may be followed by a tone
+    pattern = ""
+    for i, char in enumerate(prefix):
+        pattern += re.escape(char)
+        if not char.isdigit() and not prefix[i + 1 : i + 2].isdigit():
+            pattern += f"[{PINYIN_TONES}]?"
+    return re.compile(pattern)
+
+
+class SuggestionIndex:
+    """Sorted search keys with the id of the entry each one belongs to"""
+
+    def __init__(self, items):
+        """Build the index from (key, entry id) pairs"""
+        items = sorted(set(items))
+        self.keys = [key for key, _ in items]
+        self.entry_ids = array("i", (entry_id for _, entry_id in items))
+        # toned pinyin keys, to check the tones that were given when some are missing
+        self.pinyin = {}
+
+    @classmethod
+    def from_entries(cls, rows):
+        """Build the index from (id, simplified, traditional, toned pinyin) rows"""
+
+        def items():
+            for entry_id, simplified, traditional, pinyin_toned in rows:
+                for key in (simplified, traditional):
+                    if key:
+                        yield key, entry_id
+                if pinyin_toned:
+                    toned = pinyin_key(pinyin_toned)
+                    yield toned, entry_id
+                    yield strip_tones(toned), entry_id
+
+        index = cls(items())
+        index.pinyin = {
+            entry_id: pinyin_key(pinyin_toned)
+            for entry_id, _, _, pinyin_toned in rows
+            if pinyin_toned
+        }
+        return index
+
+    def _search(self, prefix: str, limit: int, matches=None) -> list[int]:
+        keys = self.keys
+        entry_ids = {}  # ordered set
+        i = bisect.bisect_left(keys, prefix)
+        # exact matches come first, then longer keys in sorted order
+        while i < len(keys) and len(entry_ids) < limit and keys[i].startswith(prefix):
+            entry_id = self.entry_ids[i]
+            if matches is None or matches(entry_id):
+                entry_ids[entry_id] = None
+            i += 1
+        return list(entry_ids)
+
+    def search(self, keyword: str, limit: int = 10) -> list[int]:
+        """Get the ids of up to limit entries with a key starting with the keyword"""
+        prefix = pinyin_key(keyword.strip())
+        if not prefix:
+            return []
+
+        entry_ids = self._search(prefix, limit)
+        # e.g., "ji lei3" has a tone for only some of the syllables
+        toneless = strip_tones(prefix)
+        if not entry_ids and toneless != prefix:
+            regex = partial_tones_regex(prefix)
+            entry_ids = self._search(
+                toneless, limit, lambda i: bool(regex.match(self.pinyin.get(i, "")))
+            )
+        return entry_ids
+
+    def __len__(self):
+        return len(self.keys)
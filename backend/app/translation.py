@@ -0,0 +1,205 @@
+import asyncio
+import importlib.util
+import os
+import random
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+from backend.app.cache import TwoTierCache, content_key, normalize_text
+
+env_path = Path(__file__).resolve().parent / ".env"
+if env_path.exists():
+    load_dotenv(dotenv_path=env_path)
+
+TRANSLATION_API_KEY = os.getenv("TRANSLATION_API_KEY")
+TRANSLATION_API_URL = os.getenv("TRANSLATION_API_URL")
+
+# timeout for a single attempt, and the deadline for all attempts together
+TRANSLATION_TIMEOUT = float(os.getenv("TRANSLATION_TIMEOUT", 5))
+TRANSLATION_DEADLINE = float(os.getenv("TRANSLATION_DEADLINE", 15))
+TRANSLATION_RETRIES = int(os.getenv("TRANSLATION_RETRIES", 3))
+RETRY_BACKOFF = 0.25  # seconds, doubled after every attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Concurrent requests for the same target language are collected for a few
+# milliseconds and sent as one API call (which accepts up to 50 texts)
+BATCH_WINDOW = float(os.getenv("TRANSLATION_BATCH_WINDOW", 0.005))  # seconds
+MAX_BATCH_SIZE = 50
+
+# HTTP/2 is only used if the h2 package is installed (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Translations of the same text don't change, so they are cached for a long time
+translation_cache = TwoTierCache(
+    "translation",
+    max_bytes=int(os.getenv("TRANSLATION_CACHE_BYTES", 16 * 1024 * 1024)),
+    ttl=int(os.getenv("TRANSLATION_CACHE_TTL", 30 * 24 * 60 * 60)),
+    local_ttl=int(os.getenv("TRANSLATION_CACHE_LOCAL_TTL", 24 * 60 * 60)),
+)
+
+_client = None
+_client_loop = None
+_batcher = None
+_batcher_loop = None
+
+
+class TranslationError(Exception):
+    pass
+
+
+def get_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client, which keeps connections to the API alive"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # connections belong to an event loop, so a new loop needs a new client
+    if _client is None or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(TRANSLATION_TIMEOUT),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+        _client = _client_loop = None
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None = None) -> float:
+    """Exponential backoff with jitter (or whatever the API asks for)"""
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return float(response.headers["Retry-After"])
+    return RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+async def _request_translations(texts: list[str], target_lang: str) -> list[str]:
+    params = {
+        "auth_key": TRANSLATION_API_KEY,
+        "text": texts,  # sent as repeated text parameters
+        "target_lang": target_lang,
+    }
+
+    client = get_client()
+    async with asyncio.timeout(TRANSLATION_DEADLINE):
+        for attempt in range(TRANSLATION_RETRIES + 1):
+            last_attempt = attempt == TRANSLATION_RETRIES
+            try:
+                response = await client.post(TRANSLATION_API_URL, data=params)
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+                await asyncio.sleep(_retry_delay(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and not last_attempt:
+                await asyncio.sleep(_retry_delay(attempt, response))
+                continue
+
+            if response.status_code != 200:
+                raise TranslationError(
+                    f"Translation API returned status {response.status_code}"
+                )
+
+            return [translation["text"] for translation in response.json()["translations"]]
+
+
+class TranslationBatcher:
+    """Coalesces concurrent translation requests into as few API calls as possible"""
+
+    def __init__(self):
+        self._futures = {}  # (target_lang, text) -> future, until the translation is done
+        self._queues = {}  # target_lang -> texts that haven't been sent yet
+        self._timers = {}  # target_lang -> scheduled flush
+        self._tasks = set()  # keep a reference to running requests
+
+    async def translate(self, text: str, target_lang: str) -> str:
+        key = (target_lang, text)
+        future = self._futures.get(key)
+
+        # identical texts that are already queued or being translated share the result
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+
+            queue = self._queues.setdefault(target_lang, [])
+            queue.append(text)
+            if len(queue) >= MAX_BATCH_SIZE:
+                self._flush(target_lang)
+            elif len(queue) == 1:
+                self._timers[target_lang] = loop.call_later(
+                    BATCH_WINDOW, self._flush, target_lang
+                )
+
+        # don't cancel the shared request if just one of the callers goes away
+        return await asyncio.shield(future)
+
+    def _flush(self, target_lang: str):
+        timer = self._timers.pop(target_lang, None)
+        if timer is not None:
+            timer.cancel()
+
+        texts = self._queues.pop(target_lang, [])
+        if texts:
+            task = asyncio.create_task(self._send(texts, target_lang))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, texts: list[str], target_lang: str):
+        try:
+            translations = await _request_translations(texts, target_lang)
+            if len(translations) != len(texts):
+                raise TranslationError("Translation API returned the wrong number of texts")
+        except Exception as e:
+            for text in texts:
+                self._futures.pop((target_lang, text)).set_exception(e)
+        else:
+            for text, translated_text in zip(texts, translations):
+                self._futures.pop((target_lang, text)).set_result(translated_text)
+        finally:
+            # e.g., cancelled at shutdown, which mustn't leave the texts waiting forever
+            for text in texts:
+                future = self._futures.pop((target_lang, text), None)
+                if future is not None:
+                    future.set_exception(TranslationError("Translation was cancelled"))
+
+
+def get_batcher() -> TranslationBatcher:
+    global _batcher, _batcher_loop
+    loop = asyncio.get_running_loop()
+    # futures belong to an event loop as well
+    if _batcher is None or _batcher_loop is not loop:
+        _batcher = TranslationBatcher()
+        _batcher_loop = loop
+    return _batcher
+
+
+async def translate_text(text: str, target_lang: str) -> str:
+    text = normalize_text(text)
+    # e.g., "zh" and "ZH" are the same request (for the batcher as well as the cache)
+    target_lang = target_lang.upper()
+    key = content_key(text, target_lang)
+
+    # the cache is backed by (blocking) redis, so it's used from a worker thread
+    translated_text = await asyncio.to_thread(translation_cache.get, key)
+    if translated_text is None:
+        translated_text = await get_batcher().translate(text, target_lang)
+        await asyncio.to_thread(translation_cache.set, key, translated_text)
+
+    return translated_text
+
+
+async def translate_texts(texts: list[str], target_lang: str) -> list[str]:
+    """Translate several texts, through the same cache and batches as single texts"""
+    results = await asyncio.gather(
+        *(translate_text(text, target_lang) for text in texts), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
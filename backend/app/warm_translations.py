@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+import redis
+from sqlalchemy.orm import Session
+
+import backend.app.crud as crud
+import backend.app.translation as translation
+from backend.app.cache import REDIS_RETRY_AFTER, r
+from backend.app.database import SessionLocal
+
+# Translations of the example sentences are stored in the database, so that viewing
+# a sentence doesn't need the translation API. This job fills the table ahead of
+# time: the most viewed sentences first, then everything else in id order, in
+# batches that are sent no faster than the API allows.
+# Usage: python -m backend.app.warm_translations [--most-viewed N] [--rate R] [--limit N]
+
+logger = logging.getLogger(__name__)
+
+# sorted set of sentence id -> number of views
+VIEWS_KEY = "sentence_views"
+
+DEFAULT_TARGET_LANG = "EN"
+WARM_BATCH_SIZE = translation.MAX_BATCH_SIZE
+WARM_RATE = float(os.getenv("TRANSLATION_WARM_RATE", 1))  # API calls per second, 0 for no limit
+MOST_VIEWED = int(os.getenv("TRANSLATION_WARM_MOST_VIEWED", 10000))
+
+_views_down_until = 0
+
+
+def record_view(sentence_id: int):
+    """Count a view of the sentence (best effort, since it only affects warming order)"""
+    global _views_down_until
+    if time.monotonic() < _views_down_until:
+        return
+    try:
+        r.zincrby(VIEWS_KEY, 1, sentence_id)
+    except redis.RedisError as e:
+        logger.warning("Not counting sentence views: %s", e)
+        _views_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+
+def get_most_viewed(limit: int) -> list[int]:
+    """Get the ids of the most viewed sentences, most viewed first"""
+    try:
+        return [int(sentence_id) for sentence_id in r.zrevrange(VIEWS_KEY, 0, limit - 1)]
+    except redis.RedisError as e:
+        logger.warning("Couldn't get the most viewed sentences: %s", e)
+        return []
+
+
+async def _translate_batches(
+    db: Session, target_lang: str, batches, rate: float, limit: int | None
+) -> int:
+    translated = 0
+    next_call = time.monotonic()
+    async for batch in batches:
+        if limit is not None:
+            if translated >= limit:
+                break
+            batch = batch[:limit - translated]
+
+        # spread the API calls out evenly
+        if rate:
+            await asyncio.sleep(max(0.0, next_call - time.monotonic()))
+            next_call = time.monotonic() + 1 / rate
+
+        texts = [text for _, text in batch]
+        try:
+            translations = await translation.translate_texts(texts, target_lang)
+        except (translation.TranslationError, httpx.HTTPError, TimeoutError) as e:
+            # left for the next run
+            logger.warning("Couldn't translate %d sentences: %s", len(batch), e)
+            continue
+
+        results = {sentence_id: text for (sentence_id, _), text in zip(batch, translations)}
+        await asyncio.to_thread(crud.save_sentence_translations, db, target_lang, results)
+        translated += len(results)
+
+    return translated
+
+
+async def warm_translations(
+    db: Session,
+    target_lang: str = DEFAULT_TARGET_LANG,
+    most_viewed: int = MOST_VIEWED,
+    rate: float = WARM_RATE,
+    batch_size: int = WARM_BATCH_SIZE,
+    limit: int | None = None,
+) -> int:
+    """Translate and store sentences that don't have a stored translation yet"""
+    if rate < 0:
+        raise ValueError("The rate can't be negative")
+
+    async def viewed_batches():
+        # the order of the views is kept, so a batch is looked up per slice
+        sentence_ids = get_most_viewed(most_viewed) if most_viewed else []
+        for i in range(0, len(sentence_ids), batch_size):
+            ids = sentence_ids[i:i + batch_size]
+            rows = await asyncio.to_thread(
+                crud.get_untranslated_sentences, db, target_lang, batch_size, 0, ids
+            )
+            if rows:
+                yield rows
+
+    async def remaining_batches():
+        after_id = 0
+        while rows := await asyncio.to_thread(
+            crud.get_untranslated_sentences, db, target_lang, batch_size, after_id
+        ):
+            yield rows
+            after_id = rows[-1][0]
+
+    translated = await _translate_batches(db, target_lang, viewed_batches(), rate, limit)
+    if limit is not None:
+        limit -= translated
+    translated += await _translate_batches(db, target_lang, remaining_batches(), rate, limit)
+    return translated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store translations of the example sentences")
+    parser.add_argument("--target-lang", default=DEFAULT_TARGET_LANG)
+    parser.add_argument("--most-viewed", type=int, default=MOST_VIEWED)
+    parser.add_argument("--rate", type=float, default=WARM_RATE, help="API calls per second (0 for no limit)")
+    parser.add_argument("--limit", type=int, help="maximum number of sentences to translate")
+    args = parser.parse_args()
+
+    async def main():
+        with SessionLocal() as db:
+            try:
+                return await warm_translations(
+                    db, args.target_lang, args.most_viewed, args.rate, limit=args.limit
+                )
+            finally:
+                await translation.close_client()
+
+    print(f"Translated {asyncio.run(main())} sentences")
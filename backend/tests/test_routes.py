@@ -1,37 +1,113 @@
+import ast
+import asyncio
+import collections
+import glob
+import json
+import os
+import shutil
+import threading
+import urllib.parse
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 import sqlalchemy
+from alembic import command
+from alembic.config import Config
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import sessionmaker
 
+from backend.app import (
+    crud,
+    executors,
+    frequency,
+    lookups,
+    models,
+    normalization,
+    planner,
+    postings,
+    schemas,
+    sentence_metrics,
+    translation,
+)
+from backend.app.cache import LRUCache, TwoTierCache
 from backend.app.database import get_db
-from backend.app.helpers import hash_password
-from backend.app.main import app
+from backend.app.helpers import hash_password, pinyin_sequences, split_text_cached
+from backend.app.main import app, analysis_cache
+from backend.app.segmenter import TrieEngine
+from backend.app.shared_table import SharedTable, write_table
+from backend.app.suggest import SuggestionIndex
+from backend.app.warm_translations import warm_translations
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_DATABASE_FILE = "./test.db"
 
-engine = sqlalchemy.create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# created by the migrated_db fixture, for a copy of the database
+engine = None
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 
 # These two event listeners are only needed for sqlite for proper
 # SAVEPOINT / nested transaction support. Other databases like postgres
 # don't need them.
 # From: https://docs.sqlalchemy.org/en/14/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl
-@sqlalchemy.event.listens_for(engine, "connect")
 def do_connect(dbapi_connection, connection_record):
     # disable pysqlite's emitting of the BEGIN statement entirely.
     # also stops it from emitting COMMIT before any DDL.
     dbapi_connection.isolation_level = None
 
 
-@sqlalchemy.event.listens_for(engine, "begin")
 def do_begin(conn):
     # emit our own BEGIN
     conn.exec_driver_sql("BEGIN")
 
 
+def create_test_engine(path) -> sqlalchemy.Engine:
+    test_engine = sqlalchemy.create_engine(
+        f"sqlite:///{path}", connect_args={"check_same_thread": False}
+    )
+    sqlalchemy.event.listen(test_engine, "connect", do_connect)
+    sqlalchemy.event.listen(test_engine, "begin", do_begin)
+    return test_engine
+
+
+# test.db is a fixture with the schema of the last migration before the
+# migrations were tracked, so bring it to the current schema before any test runs.
+# That happens on a copy, so that the tracked file isn't changed by running the tests.
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+BASELINE_REVISION = "aba8a3714c27"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def migrated_db(tmp_path_factory):
+    global engine
+    path = tmp_path_factory.mktemp("db") / "test.db"
+    shutil.copyfile(SQLALCHEMY_DATABASE_FILE, path)
+    engine = create_test_engine(path)
+    TestingSessionLocal.configure(bind=engine)
+
+    config = Config()
+    config.set_main_option("script_location", os.path.join(ROOT_DIR, "migrations"))
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        if not sqlalchemy.inspect(connection).has_table("alembic_version"):
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
+
+    # fill in what the migrations leave to the offline jobs
+    with TestingSessionLocal() as db:
+        if db.query(models.SentencePosting).first() is None:
+            postings.build_postings(db)
+        if db.query(models.Sentence).filter(models.Sentence.token_count.is_(None)).first():
+            sentence_metrics.update_sentence_metrics(db)
+        if db.query(models.Entry).filter(models.Entry.frequency_rank.is_(None)).first():
+            frequency.update_frequency_ranks(db)
+    executors.shutdown_segmentation_pool()
+
+    yield
+    engine.dispose()
+
+
 # This fixture is the main difference to before. It creates a nested
 # transaction, recreates it when the application code calls session.commit
 # and rolls it back at the end.
@@ -172,6 +248,161 @@ def test_get_sentences_default(client):
     assert len(response.json()) == 100
 
 
+@pytest.mark.parametrize("keyword", ["一般做些", "你好", "的"])
+def test_get_sentences_keyword(client, keyword):
+    """Keyword search should only return sentences that contain the keyword."""
+    response = client.get("/sentences", params={"keyword": keyword, "limit": 20})
+    assert response.status_code == 200
+    sentences = response.json()
+    assert sentences
+    assert all(keyword in sentence["text"] for sentence in sentences)
+
+
+def test_migrations_are_self_contained():
+    """Migrations shouldn't import the app, which changes after they are written."""
+    for path in glob.glob(os.path.join(ROOT_DIR, "migrations", "versions", "*.py")):
+        with open(path, encoding="utf-8") as file:
+            tree = ast.parse(file.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                modules = [node.module or ""]
+            else:
+                continue
+            assert not any(module.startswith("backend") for module in modules), path
+
+
+@pytest.mark.parametrize("keyword", [None, "我们", "一般做些"])
+def test_get_sentences_cursor(client, keyword):
+    """Following next_cursor should return every sentence once, in id order."""
+    params = {"limit": 7, "cursor": "", "keyword": keyword}
+    ids = []
+    for _ in range(3):
+        response = client.get("/sentences", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        ids += [sentence["id"] for sentence in page["items"]]
+        if page["next_cursor"] is None:
+            break
+        assert len(page["items"]) == 7
+        params["cursor"] = page["next_cursor"]
+
+    assert ids
+    assert ids == sorted(set(ids))
+
+    # the same as the first pages with offset pagination
+    if keyword is None:
+        response = client.get("/sentences", params={"limit": len(ids)})
+        assert [sentence["id"] for sentence in response.json()] == ids
+
+
+def test_get_sentences_by_difficulty(client, session):
+    """Filtered sentences should be within the limits, from easiest to hardest."""
+    params = {"max_level": 2, "max_unknown_ratio": 0.1, "sort": "difficulty", "limit": 50}
+    sentences = client.get("/sentences", params=params).json()
+    assert len(sentences) == 50
+
+    rows = [session.get(models.Sentence, sentence["id"]) for sentence in sentences]
+    assert all(row.max_hsk_level <= 2 and row.unknown_ratio <= 0.1 for row in rows)
+    assert [row.difficulty for row in rows] == sorted(row.difficulty for row in rows)
+
+
+def test_get_sentences_difficulty_cursor(client):
+    """Pages sorted by difficulty should continue where the previous one ended."""
+    params = {"max_level": 3, "sort": "difficulty", "limit": 10}
+    expected = client.get("/sentences", params={**params, "limit": 30}).json()
+
+    ids = []
+    params["cursor"] = ""
+    for _ in range(3):
+        page = client.get("/sentences", params=params).json()
+        ids += [sentence["id"] for sentence in page["items"]]
+        params["cursor"] = page["next_cursor"]
+    assert ids == [sentence["id"] for sentence in expected]
+
+    # a cursor for a different sort can't be used
+    response = client.get("/sentences", params={"cursor": params["cursor"]})
+    assert response.status_code == 400
+
+
+def test_compute_sentence_metrics():
+    hsk_lookup = {"我": 1, "学习": 1, "汉语": 3}
+    metrics = sentence_metrics.compute_metrics(["我", "学习", "汉语", "语法"], hsk_lookup)
+    assert metrics["token_count"] == 4
+    assert metrics["max_hsk_level"] == 3
+    assert metrics["unknown_ratio"] == 0.25
+    assert metrics["difficulty"] == (1 + 1 + 3 + 7) / 4 + 0.25 * 2
+
+    assert sentence_metrics.compute_metrics([], hsk_lookup)["difficulty"] is None
+
+    unknown = sentence_metrics.compute_metrics(["语法", "汤姆"], hsk_lookup)
+    assert unknown["max_hsk_level"] == sentence_metrics.UNKNOWN_LEVEL
+    assert unknown["unknown_ratio"] == 1
+
+
+def test_get_sentences_by_level_excludes_unknown(client, session):
+    """A sentence without any HSK word shouldn't pass a max_level filter."""
+    metrics = sentence_metrics.compute_metrics(["汤姆"], {})
+    sentence = models.Sentence(text="汤姆！", text_normalized="汤姆！", **metrics)
+    session.add(sentence)
+    session.commit()
+
+    response = client.get("/sentences", params={"keyword": "汤姆！", "max_level": 6})
+    assert response.status_code == 200
+    assert sentence.id not in [s["id"] for s in response.json()]
+
+    response = client.get("/sentences", params={"keyword": "汤姆！"})
+    assert sentence.id in [s["id"] for s in response.json()]
+
+
+def test_get_sentences_invalid_cursor(client):
+    response = client.get("/sentences", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "route,simplified,traditional",
+    [
+        ("/sentences", "我们试试", "我們試試"),
+        ("/sentences", "学习", "學習"),
+        ("/dictionary", "学习", "學習"),
+    ],
+)
+def test_search_either_script(client, route, simplified, traditional):
+    """Simplified and traditional keywords should find the same results."""
+    results = [
+        client.get(route, params={"keyword": keyword, "limit": 50}).json()
+        for keyword in (simplified, traditional)
+    ]
+    assert results[0]
+    assert results[0] == results[1]
+
+
+def test_build_character_map():
+    pairs = [("學習", "学习"), ("乾淨", "干净"), ("乾杯", "干杯"), ("乾隆", "乾隆"), ("電腦", "电脑")]
+    char_map = normalization.build_character_map(pairs)
+    assert char_map == {"學": "学", "習": "习", "乾": "干", "淨": "净", "電": "电", "腦": "脑"}
+
+
+def test_script_table_not_cached_empty(session, monkeypatch):
+    """A table built before the mapping is populated shouldn't stick."""
+    monkeypatch.setattr(lookups, "_script_table", None)
+    session.query(models.CharacterMapping).delete()
+    assert lookups.get_script_table(session) == {}
+
+    session.add(models.CharacterMapping(traditional="學", simplified="学"))
+    session.flush()
+    assert lookups.get_script_table(session) == {ord("學"): "学"}
+
+
+def test_migrated_normalized_columns(session):
+    """The migration fills the normalized columns of the existing rows."""
+    assert session.query(models.CharacterMapping).count()
+    for column in (models.Entry.normalized, models.Sentence.text_normalized):
+        assert session.query(column.class_).filter(column.is_(None)).count() == 0
+
+
 def test_get_sentences_limit(client):
     """Check if the sentence limit is applied."""
     response = client.get("/sentences", params={"limit": 30000})
@@ -179,6 +410,14 @@ def test_get_sentences_limit(client):
     assert len(response.json()) == 30000
 
 
+@pytest.mark.parametrize("route", ["/sentences", "/dictionary"])
+@pytest.mark.parametrize("cursor", [None, ""])
+@pytest.mark.parametrize("limit", [0, -1])
+def test_invalid_limit(client, route, cursor, limit):
+    response = client.get(route, params={"limit": limit, "cursor": cursor})
+    assert response.status_code == 422
+
+
 def test_get_dictionary_entries_default(client):
     """Check if the dictionary entries are created."""
     response = client.get("/dictionary")
@@ -193,6 +432,292 @@ def test_get_dictionary_entries_limit(client):
     assert len(response.json()) == 5000
 
 
+@pytest.fixture()
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if statement.startswith(("SELECT", "WITH")):  # not the test's savepoints
+            statements.append(statement)
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    sqlalchemy.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.parametrize("limit", [5, 50])
+def test_get_dictionary_entries_queries(client, count_queries, limit):
+    """Entries are loaded with a fixed number of queries, however many there are."""
+    response = client.get("/dictionary", params={"limit": limit})
+    assert response.status_code == 200
+    entries = [schemas.Entry.model_validate(entry) for entry in response.json()]
+    assert len(entries) == limit
+    assert all(entry.pronunciations and entry.definitions for entry in entries)
+    assert len(count_queries) == 3
+
+
+@pytest.mark.parametrize("keyword", ["ji1lei3", "jilei", "ji lei", "Ji1 lei", "ji lei3"])
+def test_get_dictionary_entries_pinyin(client, keyword):
+    """Multi-syllable pinyin should match with or without tones and spaces."""
+    response = client.get("/dictionary", params={"keyword": keyword})
+    assert response.status_code == 200
+    assert "积累" in [entry["simplified"] for entry in response.json()]
+
+
+@pytest.mark.parametrize("keyword", ["积lei", "ji累", "積 lei3", "积lei3", "积le", "积l"])
+def test_get_dictionary_entries_mixed(client, keyword):
+    """Characters mixed with pinyin should match position by position."""
+    response = client.get("/dictionary", params={"keyword": keyword})
+    assert response.status_code == 200
+    assert response.json()[0]["simplified"] == "积累"
+
+
+@pytest.mark.parametrize("keyword", ["积lei2", "积li", "累ji", "ji累l"])
+def test_get_dictionary_entries_mixed_no_match(client, keyword):
+    response = client.get("/dictionary", params={"keyword": keyword})
+    assert "积累" not in [entry["simplified"] for entry in response.json()]
+
+
+@pytest.mark.parametrize(
+    "keyword,tokens",
+    [
+        ("好Kan4", ["好", "kan4"]),
+        ("ni好", ["ni", "好"]),
+        ("好k", ["好", "k"]),
+        ("hao kan", ["hao", "kan"]),
+        ("k好", None),
+    ],
+)
+def test_tokenize_query(keyword, tokens):
+    assert planner.tokenize_query(keyword) == tokens
+
+
+def test_position_index_prefix():
+    rows = [(1, "积累", "ji1 lei3"), (2, "积极", "ji1 ji2"), (3, "累计", "lei3 ji4")]
+    index = planner.PositionIndex.from_entries(rows)
+    assert index.search(["积", "le"], prefix=True) == [1]
+    assert index.search(["积", "j"], prefix=True) == [2]
+    assert index.search(["积", "le"]) == []
+    assert index.search(["ji", "l"], prefix=True) == [1]
+    assert index.search(["积", "x"], prefix=True) == []
+
+
+def test_position_index_anywhere():
+    rows = [(1, "积累", "ji1 lei3"), (2, "累积", "lei3 ji1"), (3, "日积月累", "ri4 ji1 yue4 lei3")]
+    index = planner.PositionIndex.from_entries(rows)
+    assert index.search_anywhere(["积"]) == [1, 2, 3]
+    assert index.search_anywhere(["积", "累"]) == [1]
+    assert index.search_anywhere(["积", "月", "累"]) == [3]
+    assert index.search_anywhere(["日", "积", "月", "累", "了"]) == []
+
+
+@pytest.mark.parametrize("keyword", ["学", "学习", "日积月累"])
+def test_search_characters_anywhere(session, keyword):
+    """The position index should find the same entries as a substring search."""
+    query = session.query(models.Entry.id)
+    found, _ = crud.match_characters(session, query, keyword)
+    expected = query.filter(models.Entry.normalized.contains(keyword))
+    assert {row.id for row in found} == {row.id for row in expected}
+
+
+def test_intersect_posting_lists():
+    lists = [
+        array("i", range(0, 1000, 3)),
+        array("i", [3, 4, 9, 500, 999]),
+        array("i", range(0, 1000, 9)),
+    ]
+    assert planner.intersect(lists) == [9, 999]
+    assert planner.intersect([array("i", [1, 2]), array("i")]) == []
+
+
+def test_get_dictionary_entries_pinyin_wrong_tone(client):
+    response = client.get("/dictionary", params={"keyword": "ji2 lei"})
+    assert "积累" not in [entry["simplified"] for entry in response.json()]
+
+
+@pytest.mark.parametrize("keyword", ["雪", "xue", "xue3"])
+def test_get_dictionary_entries_ranking(client, session, keyword):
+    """Full matches come first, then shorter words (then more frequent ones)."""
+    response = client.get("/dictionary", params={"keyword": keyword, "limit": 50})
+    entries = response.json()
+    ranks = dict(session.query(models.Entry.id, models.Entry.frequency_rank))
+
+    def is_exact(entry):
+        pinyin = "".join(p["pinyin"] for p in entry["pronunciations"])
+        return keyword in (entry["simplified"], pinyin, pinyin.rstrip("12345"))
+
+    assert is_exact(entries[0])
+    rest = [entry for entry in entries if not is_exact(entry)]
+    assert entries[len(entries) - len(rest):] == rest
+    keys = [(len(entry["simplified"]), ranks[entry["id"]]) for entry in rest]
+    assert keys == sorted(keys)
+
+
+@pytest.mark.parametrize("english", ["study", "Studies", '"to study"'])
+def test_get_dictionary_entries_english(client, count_queries, english):
+    """Definitions are searched by stemmed words and phrases."""
+    response = client.get("/dictionary", params={"english": english, "limit": 50})
+    assert response.status_code == 200
+    assert "学习" in [entry["simplified"] for entry in response.json()]
+    assert len(count_queries) == 3
+
+
+def test_get_dictionary_entries_english_phrase(client):
+    response = client.get("/dictionary", params={"english": '"study to"'})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_get_dictionary_entries_english_with_keyword(client):
+    response = client.get("/dictionary", params={"english": "study", "keyword": "xue"})
+    assert response.status_code == 400
+
+
+def test_migrated_definition_positions(session):
+    """The migration numbers the existing definitions of every entry in order."""
+    rows = (
+        session.query(models.Definition.entry_id, models.Definition.position)
+        .order_by(models.Definition.entry_id, models.Definition.id)
+        .all()
+    )
+    positions = collections.defaultdict(list)
+    for entry_id, position in rows:
+        positions[entry_id].append(position)
+    assert all(p == list(range(len(p))) for p in positions.values())
+
+
+def test_rank_entries():
+    counts = collections.Counter({"学": 5, "学生": 3, "我": 10})
+    rows = [(1, "学生", 2), (2, "学", 1), (3, "学习", 2), (4, "我", 1), (5, "习", 1)]
+    assert frequency.rank_entries(rows, counts) == {4: 1, 2: 2, 1: 3, 5: 4, 3: 5}
+
+
+def test_pinyin_sequences():
+    assert pinyin_sequences(["Lu:4", "shi1"]) == ("lv4 shi1", "lv shi")
+
+
+def test_migrated_pinyin_sequences(session):
+    """The migration fills the sequences of the existing entries like Entry.create."""
+    entries = session.query(models.Entry).order_by(models.Entry.id).limit(200).all()
+    for entry in entries:
+        pronunciations = sorted(entry.pronunciations, key=lambda p: p.position)
+        expected = pinyin_sequences([p.pinyin for p in pronunciations])
+        assert (entry.pinyin_toned, entry.pinyin_toneless) == expected
+
+
+@pytest.mark.parametrize("keyword", [None, "学", "xue"])
+def test_get_dictionary_entries_cursor(client, keyword):
+    """Following next_cursor should return every entry once, in id order."""
+    first = client.get("/dictionary", params={"limit": 4, "cursor": "", "keyword": keyword})
+    assert first.status_code == 200
+    first = first.json()
+    assert len(first["items"]) == 4
+    assert first["next_cursor"] is not None
+
+    params = {"limit": 4, "cursor": first["next_cursor"], "keyword": keyword}
+    second = client.get("/dictionary", params=params).json()
+    ids = [entry["id"] for entry in first["items"] + second["items"]]
+    assert ids == sorted(set(ids))
+
+
+@pytest.mark.parametrize("keyword", ["积", "積累", "ji", "ji lei", "JILEI", "ji1lei3", "ji lei3"])
+def test_suggestion_index(keyword):
+    index = SuggestionIndex.from_entries(
+        [(1, "积累", "積累", "ji1 lei3"), (2, "积", "積", "ji1"), (3, "机", "機", "ji1")]
+    )
+    assert 1 in index.search(keyword)
+    assert index.search("ji2lei") == []
+    assert index.search("ji", limit=2) == [2, 3]  # exact matches first
+
+
+def test_suggest_dictionary_entries(client, session):
+    lookups.reload_suggestion_index(session)
+    response = client.get("/dictionary/suggest", params={"keyword": "jile"})
+    assert response.status_code == 200
+    assert "积累" in [entry["simplified"] for entry in response.json()]
+
+
+def test_dictionary_reloaded_elsewhere(client, session, monkeypatch):
+    """A server should notice when another process (e.g., load_data) reloads the dictionary."""
+    for name in ("_trie_engine", "_script_table", "_suggestion_index", "_position_index"):
+        monkeypatch.setattr(lookups, name, None)
+    monkeypatch.setattr(lookups, "_data_versions", None)
+    monkeypatch.setattr(lookups, "DATA_VERSION_INTERVAL", 0)
+    lookups.get_suggestion_index(session)
+    lookups.get_position_index(session)
+
+    # a made-up word, so that it can't already be in the dictionary
+    entry = models.Entry.create("积积积", "積積積", ["ji1", "ji1", "ji1"], ["test"])
+    entry.normalized = entry.simplified
+    session.add(entry)
+    lookups.bump_data_version(session, "dictionary")
+
+    response = client.get("/dictionary/suggest", params={"keyword": "jijiji"})
+    assert "积积积" in [entry["simplified"] for entry in response.json()]
+    response = client.get("/dictionary", params={"keyword": "积jiji"})
+    assert "积积积" in [entry["simplified"] for entry in response.json()]
+
+
+def test_postings_encoding():
+    sentence_ids = [7, 3, 70000, 3, 12]
+    data = postings.encode_postings(sentence_ids)
+    assert postings.decode_postings(data).tolist() == [3, 7, 12, 70000]
+
+
+def test_get_word_sentences(client, session):
+    """Example sentences should come from the posting lists, shortest first."""
+    word = session.query(models.Word).filter(models.Word.simplified == "学习").first()
+    sentences = session.query(models.Sentence).order_by(models.Sentence.id).limit(5).all()
+
+    session.query(models.SentencePosting).filter(
+        models.SentencePosting.word.in_([word.simplified, word.traditional])
+    ).delete()
+    session.add(
+        models.SentencePosting(
+            word=word.simplified,
+            sentence_count=len(sentences),
+            sentence_ids=postings.encode_postings([s.id for s in sentences]),
+        )
+    )
+    session.commit()
+
+    response = client.get(f"/words/{word.id}/sentences", params={"limit": 3})
+    assert response.status_code == 200
+    expected = sorted(sentences, key=lambda s: (len(s.text), s.id))[:3]
+    assert [s["id"] for s in response.json()] == [s.id for s in expected]
+
+
+def test_get_word_sentences_by_difficulty(client, session):
+    """Example sentences can be sorted by difficulty instead, easiest first."""
+    word = session.query(models.Word).filter(models.Word.simplified == "学习").first()
+    response = client.get(
+        f"/words/{word.id}/sentences", params={"limit": 10, "sort": "difficulty"}
+    )
+    assert response.status_code == 200
+    sentence_ids = [s["id"] for s in response.json()]
+    assert sentence_ids
+
+    difficulties = dict(
+        session.query(models.Sentence.id, models.Sentence.difficulty).filter(
+            models.Sentence.id.in_(sentence_ids)
+        )
+    )
+    keys = [(difficulties[i] is None, difficulties[i] or 0, i) for i in sentence_ids]
+    assert keys == sorted(keys)
+
+
+@pytest.mark.parametrize("route", ["/dictionary/1/sentences", "/words/1/sentences"])
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": -1}, {"offset": -1}])
+def test_example_sentences_invalid_page(client, route, params):
+    response = client.get(route, params=params)
+    assert response.status_code == 422
+
+
+def test_get_entry_sentences_not_found(client):
+    response = client.get("/dictionary/0/sentences")
+    assert response.status_code == 404
+
+
 @pytest.mark.parametrize(
     "initial_text,parsed_text",
     [
@@ -231,6 +756,233 @@ def test_analyzer_submit_text(client, initial_text, parsed_text):
     assert response.json() == parsed_text
 
 
+def test_analyzer_cached(client):
+    """Analyzing the same text again should be served from the cache."""
+    text = "我觉得这个网站的构思非常好。"
+    first = client.post("/analyzer", json={"text": text})
+
+    hits = analysis_cache.hits
+    second = client.post("/analyzer", json={"text": f"  {text}\n"})
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert analysis_cache.hits == hits + 1
+
+
+@pytest.mark.parametrize("mode", ["jieba-full", "jieba", "trie"])
+def test_analyzer_modes(client, mode):
+    response = client.post(
+        "/analyzer", params={"mode": mode}, json={"text": "这是个句子。"}
+    )
+    assert response.status_code == 200
+    assert {"word": "句子", "count": 1, "hsk_level": 3} in response.json()
+
+
+def test_analyzer_enrich(client):
+    response = client.post(
+        "/analyzer", params={"enrich": True}, json={"text": "这是个句子。"}
+    )
+    assert response.status_code == 200
+
+    words = {info["word"]: info for info in response.json()}
+    assert words["句子"]["hsk_level"] == 3
+    assert any(entry["simplified"] == "句子" for entry in words["句子"]["entries"])
+    assert all(entry["pronunciations"] for entry in words["句子"]["entries"])
+
+
+def test_analyzer_coverage(client):
+    response = client.post("/analyzer/coverage", json={"text": "这是个句子。句子！"})
+    assert response.status_code == 200
+
+    result = response.json()
+    assert result["tokens"] == 5
+    assert result["types"] == 4
+    # 这, 是 and 个 are HSK 1 and 句子 is HSK 3
+    assert result["hsk"][0]["token_coverage"] == pytest.approx(3 / 5)
+    assert result["hsk"][2]["token_coverage"] == 1
+    assert result["hsk"][2]["type_coverage"] == 1
+    assert result["readability_level"] == 3
+    assert result["word_lists"] == []
+
+
+def test_analyzer_coverage_with_word_lists(client, registered_user, created_wordlist):
+    token = test_login(client, registered_user)
+    response = client.post(
+        "/analyzer/coverage",
+        json={"text": "这是个句子。"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+
+    word_lists = response.json()["word_lists"]
+    assert len(word_lists) == 1
+    assert word_lists[0]["name"] == "test"
+    assert 0 <= word_lists[0]["token_coverage"] <= 1
+
+
+def test_analyzer_invalid_mode(client):
+    response = client.post(
+        "/analyzer", params={"mode": "unknown"}, json={"text": "这是个句子。"}
+    )
+    assert response.status_code == 422
+
+
+def test_trie_engine():
+    engine = TrieEngine(["研究", "研究生", "生命", "起源", "命"])
+    # forward matching gives 研究生/命/起源, backward matching gives 研究/生命/起源
+    assert list(engine.cut("研究生命起源！OK")) == ["研究", "生命", "起源", "OK"]
+    assert engine.forward_match("研究生命") == ["研究生", "命"]
+
+
+def test_segmentation_cache_dictionary_version():
+    """Results cached with an older dictionary shouldn't be reused."""
+    text = "研究生命起源一二三"
+    old = TrieEngine(["研究", "生命", "起源"], version="old")
+    new = TrieEngine(["研究", "生命", "起源", "一二三"], version="new")
+    assert split_text_cached(text, old) == ["研究", "生命", "起源", "一", "二", "三"]
+    assert split_text_cached(text, new) == ["研究", "生命", "起源", "一二三"]
+
+
+def test_analyzer_busy(client, monkeypatch):
+    """The analyzer should fail fast when its executor is saturated."""
+    busy_executor = executors.BoundedExecutor("test", max_workers=1, max_queue=0)
+    busy_executor._slots.acquire()  # pretend that a task is running
+
+    monkeypatch.setattr(executors, "analysis_executor", busy_executor)
+    response = client.post("/analyzer", json={"text": "这是个句子。"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    busy_executor._slots.release()
+    response = client.post("/analyzer", json={"text": "这是个句子。"})
+    assert response.status_code == 200
+
+
+def test_lru_cache_eviction():
+    lru = LRUCache(max_bytes=10)
+    lru.set("a", b"1234")
+    lru.set("b", b"1234")
+    lru.get("a")  # "b" is now the least recently used value
+    lru.set("c", b"1234")
+
+    assert lru.get("a") == b"1234"
+    assert lru.get("b") is None
+    assert lru.get("c") == b"1234"
+    assert lru.size == 8
+
+
+def test_shared_table(tmp_path):
+    items = {"句": 0, "句子": 3, "这": 1, "hello": 42}
+    path = str(tmp_path / "test.table")
+    write_table(path, items.items(), extra=7)
+
+    table = SharedTable(path)
+    assert dict(table) == items
+    assert table.extra == 7
+    assert "句子" in table and "子" not in table
+    assert table["hello"] == 42
+    assert table.get("子") is None
+
+
+def test_segmentation_pool_shared():
+    """Threads starting the pool at the same time should get the same one."""
+    executors.shutdown_segmentation_pool()
+    with ThreadPoolExecutor(8) as pool:
+        pools = list(pool.map(lambda _: executors.get_segmentation_pool(), range(8)))
+    assert all(p is pools[0] for p in pools)
+    executors.shutdown_segmentation_pool()
+
+
+def test_analyzer_batch_submit(client):
+    response = client.post(
+        "/analyzer/batch",
+        json={
+            "texts": ["这是个句子。", "这是句子。"],
+        },
+    )
+    assert response.status_code == 200
+
+    documents = response.json()["documents"]
+    assert len(documents) == 2
+    assert {"word": "个", "count": 1, "hsk_level": 1} in documents[0]
+    assert {"word": "个", "count": 1, "hsk_level": 1} not in documents[1]
+
+    corpus = response.json()["corpus"]
+    assert corpus[0] in (
+        {"word": "这", "count": 2, "hsk_level": 1},
+        {"word": "是", "count": 2, "hsk_level": 1},
+        {"word": "句子", "count": 2, "hsk_level": 3},
+    )
+    assert {"word": "个", "count": 1, "hsk_level": 1} in corpus
+
+
+def test_analyzer_stream_busy(client, monkeypatch):
+    """A saturated executor should reject the stream before it starts."""
+    busy_executor = executors.BoundedExecutor("test", max_workers=1, max_queue=0)
+    monkeypatch.setattr(executors, "analysis_executor", busy_executor)
+
+    busy_executor._slots.acquire()  # pretend that a task is running
+    response = client.post("/analyzer/stream", content="这是个句子。".encode())
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    busy_executor._slots.release()
+    response = client.post("/analyzer/stream", content="这是个句子。".encode())
+    assert response.status_code == 200
+    # the slot is given back once the stream is done
+    assert busy_executor._slots.acquire(blocking=False)
+
+
+def test_analyzer_stream(client):
+    def chunks():
+        # split a character across two chunks
+        text = "这是个句子。这是句子。".encode()
+        yield text[:4]
+        yield text[4:]
+
+    response = client.post(
+        "/analyzer/stream", params={"progress": True}, content=chunks()
+    )
+    assert response.status_code == 200
+
+    frames = [json.loads(line) for line in response.text.splitlines()]
+    assert all(frame["type"] == "progress" for frame in frames[:-1])
+    assert frames[-1]["type"] == "result"
+    assert {"word": "句子", "count": 2, "hsk_level": 3} in frames[-1]["words"]
+    assert {"word": "个", "count": 1, "hsk_level": 1} in frames[-1]["words"]
+
+
+def test_health_check(client):
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+
+def test_hsk_lookup_is_shared(session):
+    """The HSK lookup table should only be built once and be read-only."""
+    hsk_lookup = lookups.get_hsk_lookup(session)
+    assert lookups.get_hsk_lookup(session) is hsk_lookup
+    assert hsk_lookup["句子"] == 3
+
+    with pytest.raises(TypeError):
+        hsk_lookup["句子"] = 1
+
+
+def test_hsk_lookup_reloaded_elsewhere(client, session, monkeypatch):
+    """A server should notice when another process (e.g., load_data) reloads the HSK lists."""
+    monkeypatch.setattr(lookups, "_hsk_lookup", None)
+    monkeypatch.setattr(lookups, "_data_versions", None)
+    monkeypatch.setattr(lookups, "DATA_VERSION_INTERVAL", 0)
+    assert lookups.get_hsk_lookup(session)["句子"] == 3
+
+    session.query(models.Word).filter(models.Word.simplified == "句子").update(
+        {models.Word.level_id: 4}
+    )
+    lookups.bump_data_version(session, "hsk")
+
+    response = client.post("/analyzer", json={"text": "这是个句子。"})
+    assert {"word": "句子", "count": 1, "hsk_level": 4} in response.json()
+
+
 @pytest.mark.parametrize(
     "initial_text,parsed_text",
     [
@@ -246,6 +998,152 @@ def test_translator_submit_text(client, initial_text, parsed_text):
     assert response.json()["translated_text"] == parsed_text
 
 
+@pytest.fixture()
+def fake_translation_api(monkeypatch):
+    """Local stand-in for the translation API (the first request fails with a 503)"""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+            params = urllib.parse.parse_qs(body)
+            requests.append(params)
+
+            if len(requests) == 1:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            translations = [{"text": f"translated {text}"} for text in params["text"]]
+            payload = json.dumps({"translations": translations}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(
+        translation, "TRANSLATION_API_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+    monkeypatch.setattr(translation, "RETRY_BACKOFF", 0.01)
+    # a private cache without redis, so that earlier runs can't answer for the API
+    monkeypatch.setattr(
+        translation,
+        "translation_cache",
+        TwoTierCache("test-translation", max_bytes=1024 * 1024, ttl=60, client=None),
+    )
+    yield requests
+
+    server.shutdown()
+
+
+def test_translator_fake_api(client, fake_translation_api):
+    text = "Please translate this sentence for the fake API."
+    response = client.post("/translator", json={"text": text})
+    assert response.status_code == 200
+    assert response.json()["translated_text"] == f"translated {text}"
+
+    # retried once after the 503
+    assert len(fake_translation_api) == 2
+    assert fake_translation_api[1]["target_lang"] == ["ZH"]
+
+
+def test_translation_batching(fake_translation_api):
+    """Concurrent translations should be sent together, without duplicates."""
+    texts = ["Batch me.", "Batch me too.", "Batch me.", "And me."]
+
+    async def translate_all():
+        return await asyncio.gather(
+            *(translation.translate_text(text, target_lang="ZH") for text in texts)
+        )
+
+    results = asyncio.run(translate_all())
+    assert results == [f"translated {text}" for text in texts]
+
+    # one failed request and its retry, each containing the distinct texts once
+    assert len(fake_translation_api) == 2
+    assert fake_translation_api[1]["text"] == ["Batch me.", "Batch me too.", "And me."]
+
+
+def test_translation_batching_target_lang_case(fake_translation_api):
+    async def translate_all():
+        return await asyncio.gather(
+            *(translation.translate_text("Case me.", target_lang) for target_lang in ["zh", "ZH"])
+        )
+
+    assert asyncio.run(translate_all()) == ["translated Case me."] * 2
+    assert fake_translation_api[1]["text"] == ["Case me."]
+    assert fake_translation_api[1]["target_lang"] == ["ZH"]
+
+
+def test_translation_batch_cancelled(monkeypatch):
+    """Callers shouldn't wait forever for a batch that was cancelled."""
+    async def request_forever(texts, target_lang):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(translation, "_request_translations", request_forever)
+
+    async def translate_cancelled():
+        batcher = translation.TranslationBatcher()
+        waiting = asyncio.create_task(batcher.translate("Cancel me.", "ZH"))
+        await asyncio.sleep(translation.BATCH_WINDOW * 2)
+        for task in batcher._tasks:
+            task.cancel()
+        with pytest.raises(translation.TranslationError):
+            await waiting
+        return batcher
+
+    batcher = asyncio.run(translate_cancelled())
+    assert not batcher._futures
+
+
+def test_translator_cached(client, fake_translation_api):
+    """Translating the same text again shouldn't call the translation API."""
+    for text in ["Only translate me once.", " Only translate me once. "]:
+        response = client.post("/translator", json={"text": text})
+        assert response.status_code == 200
+        assert response.json()["translated_text"] == "translated Only translate me once."
+
+    assert len(fake_translation_api) == 2  # the failed request and the retry
+
+
+def test_sentence_translation_stored(client, session, fake_translation_api):
+    """A sentence should only be translated once and then served from the database."""
+    for _ in range(2):
+        response = client.get("/sentence/1")
+        assert response.status_code == 200
+        sentence = response.json()
+        assert sentence["translated_sentence"] == f"translated {sentence['text']}"
+
+    assert len(fake_translation_api) == 2  # the failed request and the retry
+    stored = session.get(models.SentenceTranslation, (1, "EN"))
+    assert stored.text == sentence["translated_sentence"]
+
+
+def test_warm_translations(session, fake_translation_api):
+    """The warming job should translate sentences in batches and skip stored ones."""
+    translated = asyncio.run(
+        warm_translations(session, most_viewed=0, rate=0, batch_size=3, limit=5)
+    )
+    assert translated == 5
+    # the first batch is retried after the 503, the last one is cut short by the limit
+    assert [len(request["text"]) for request in fake_translation_api] == [3, 3, 2]
+
+    stored = session.query(models.SentenceTranslation).order_by("sentence_id").all()
+    assert [translation.sentence_id for translation in stored] == [1, 2, 3, 4, 5]
+
+
+def test_warm_translations_negative_rate(session):
+    with pytest.raises(ValueError):
+        asyncio.run(warm_translations(session, rate=-1))
+
+
 def test_read_wordlist_without_auth(client, created_wordlist):
     response = client.get("/wordlists/1")
     assert response.status_code == 401
@@ -280,6 +1178,21 @@ def test_read_wordlists(client, registered_user, created_wordlist):
     assert len(response.json()) == 1
 
 
+def test_read_wordlist_entries(client, registered_user, created_wordlist, count_queries):
+    token = test_login(client, registered_user)
+    for entry_id in range(1, 31):
+        client.post(f"/wordlists/add/{entry_id}", params={"add_wordlist_ids": [1]})
+
+    count_queries.clear()
+    response = client.get("/wordlists/1", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    wordlist = schemas.WordList.model_validate(response.json())
+    assert [entry.id for entry in wordlist.entries] == list(range(1, 31))
+    assert all(entry.pronunciations for entry in wordlist.entries)
+    # the user, the list and the links, and three queries for the entries
+    assert len(count_queries) == 6
+
+
 def test_delete_wordlists(client, registered_user, created_wordlist):
     token = test_login(client, registered_user)
     client.delete("/wordlists/1", headers={"Authorization": f"Bearer {token}"})
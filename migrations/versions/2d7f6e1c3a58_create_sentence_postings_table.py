@@ -0,0 +1,31 @@
+"""create sentence postings table
+
+Revision ID: 2d7f6e1c3a58
+Revises: 8c1e4b7a9d23
+Create Date: 2026-10-18 12:21:53.318840
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d7f6e1c3a58'
+down_revision: Union[str, None] = '8c1e4b7a9d23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sentence_postings',
+    sa.Column('word', sa.String(), nullable=False),
+    sa.Column('sentence_count', sa.Integer(), nullable=False),
+    sa.Column('sentence_ids', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('word')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sentence_postings')
@@ -0,0 +1,28 @@
+"""rank unknown sentences above hsk
+
+Revision ID: 3c7e9a1f5b42
+Revises: 9f2b6e4a1c37
+Create Date: 2026-10-18 19:26:13.408215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e9a1f5b42'
+down_revision: Union[str, None] = '9f2b6e4a1c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# sentences without any HSK word had a max_hsk_level of 0, which every max_level
+# filter let through, rather than the level of unknown words (7)
+
+
+def upgrade() -> None:
+    op.execute("UPDATE sentences SET max_hsk_level = 7 WHERE max_hsk_level = 0")
+
+
+def downgrade() -> None:
+    op.execute("UPDATE sentences SET max_hsk_level = 0 WHERE max_hsk_level = 7")
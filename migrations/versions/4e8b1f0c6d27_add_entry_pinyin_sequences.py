@@ -0,0 +1,96 @@
+"""add entry pinyin sequences
+
+Revision ID: 4e8b1f0c6d27
+Revises: e2c85f4d1b69
+Create Date: 2026-10-18 16:08:51.427093
+
+"""
+import itertools
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8b1f0c6d27'
+down_revision: Union[str, None] = 'e2c85f4d1b69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# same as helpers.normalize_pinyin
+NORMALIZED_PINYIN = "replace(replace(lower(pinyin), 'u:', 'v'), 'ü', 'v')"
+
+# SQLite's group_concat doesn't follow the order of a subquery (ORDER BY inside it
+# needs SQLite 3.44), so the sequences are put together here instead
+pronunciations = sa.table(
+    "pronunciations",
+    sa.column("id", sa.Integer),
+    sa.column("entry_id", sa.Integer),
+    sa.column("pinyin", sa.String),
+    sa.column("position", sa.Integer),
+)
+entries = sa.table(
+    "entries",
+    sa.column("id", sa.Integer),
+    sa.column("pinyin_toned", sa.String),
+    sa.column("pinyin_toneless", sa.String),
+)
+
+
+def _sqlite_fill_sequences() -> None:
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(pronunciations.c.entry_id, pronunciations.c.pinyin).order_by(
+            pronunciations.c.entry_id, pronunciations.c.position, pronunciations.c.id
+        )
+    ).all()
+
+    values = []
+    for entry_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+        toned = " ".join(
+            pinyin.lower().replace("u:", "v").replace("ü", "v") for _, pinyin in group
+        )
+        values.append({"entry_id": entry_id, "toned": toned, "toneless": re.sub("[1-5]", "", toned)})
+
+    if values:
+        connection.execute(
+            entries.update()
+            .where(entries.c.id == sa.bindparam("entry_id"))
+            .values(pinyin_toned=sa.bindparam("toned"), pinyin_toneless=sa.bindparam("toneless")),
+            values,
+        )
+
+
+POSTGRES_TONED = f"""
+UPDATE entries SET pinyin_toned = (
+    SELECT string_agg({NORMALIZED_PINYIN}, ' ' ORDER BY position) FROM pronunciations
+    WHERE pronunciations.entry_id = entries.id
+)
+"""
+
+POSTGRES_TONELESS = "UPDATE entries SET pinyin_toneless = regexp_replace(pinyin_toned, '[1-5]', '', 'g')"
+
+
+def upgrade() -> None:
+    op.add_column('entries', sa.Column('pinyin_toned', sa.String(), nullable=True))
+    op.add_column('entries', sa.Column('pinyin_toneless', sa.String(), nullable=True))
+
+    # fill them in from the existing pronunciations
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _sqlite_fill_sequences()
+    elif dialect == "postgresql":
+        op.execute(POSTGRES_TONED)
+        op.execute(POSTGRES_TONELESS)
+
+    op.create_index(op.f('ix_entries_pinyin_toned'), 'entries', ['pinyin_toned'], unique=False)
+    op.create_index(op.f('ix_entries_pinyin_toneless'), 'entries', ['pinyin_toneless'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_entries_pinyin_toneless'), table_name='entries')
+    op.drop_index(op.f('ix_entries_pinyin_toned'), table_name='entries')
+    op.drop_column('entries', 'pinyin_toneless')
+    op.drop_column('entries', 'pinyin_toned')
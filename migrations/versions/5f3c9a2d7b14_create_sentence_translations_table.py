@@ -0,0 +1,32 @@
+"""create sentence translations table
+
+Revision ID: 5f3c9a2d7b14
+Revises: aba8a3714c27
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f3c9a2d7b14'
+down_revision: Union[str, None] = 'aba8a3714c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sentence_translations',
+    sa.Column('sentence_id', sa.Integer(), nullable=False),
+    sa.Column('target_lang', sa.String(), nullable=False),
+    sa.Column('text', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['sentence_id'], ['sentences.id'], ),
+    sa.PrimaryKeyConstraint('sentence_id', 'target_lang')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sentence_translations')
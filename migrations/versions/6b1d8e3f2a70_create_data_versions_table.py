@@ -0,0 +1,30 @@
+"""create data versions table
+
+Revision ID: 6b1d8e3f2a70
+Revises: 3c7e9a1f5b42
+Create Date: 2026-10-18 21:08:52.319604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b1d8e3f2a70'
+down_revision: Union[str, None] = '3c7e9a1f5b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('data_versions',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('data_versions')
@@ -0,0 +1,33 @@
+"""add entry frequency ranks
+
+Revision ID: 7a3d5c9e2b81
+Revises: 4e8b1f0c6d27
+Create Date: 2026-10-18 17:21:09.318245
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3d5c9e2b81'
+down_revision: Union[str, None] = '4e8b1f0c6d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The frequency ranks are filled by python -m backend.app.frequency (or the loader).
+
+
+def upgrade() -> None:
+    op.add_column('entries', sa.Column('character_count', sa.Integer(), nullable=True))
+    op.add_column('entries', sa.Column('frequency_rank', sa.Integer(), nullable=True))
+    op.execute("UPDATE entries SET character_count = length(simplified)")
+    op.create_index('ix_entries_character_count_frequency_rank', 'entries', ['character_count', 'frequency_rank'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_entries_character_count_frequency_rank', table_name='entries')
+    op.drop_column('entries', 'frequency_rank')
+    op.drop_column('entries', 'character_count')
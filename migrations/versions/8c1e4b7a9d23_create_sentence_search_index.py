@@ -0,0 +1,81 @@
+"""create sentence search index
+
+Revision ID: 8c1e4b7a9d23
+Revises: 5f3c9a2d7b14
+Create Date: 2026-10-18 11:04:17.592031
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1e4b7a9d23'
+down_revision: Union[str, None] = '5f3c9a2d7b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# FTS5 trigram table on SQLite, pg_trgm GIN index on Postgres
+# The statements are copied rather than imported from backend.app.search, so that
+# this revision keeps creating the index it was written for as the app changes.
+SQLITE_UPGRADE = [
+    """
+    CREATE VIRTUAL TABLE sentences_fts
+    USING fts5(text, content='sentences', content_rowid='id', tokenize='trigram')
+    """,
+    """
+    CREATE TRIGGER sentences_fts_insert AFTER INSERT ON sentences BEGIN
+        INSERT INTO sentences_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER sentences_fts_delete AFTER DELETE ON sentences BEGIN
+        INSERT INTO sentences_fts(sentences_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER sentences_fts_update AFTER UPDATE ON sentences BEGIN
+        INSERT INTO sentences_fts(sentences_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO sentences_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    "INSERT INTO sentences_fts(sentences_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER sentences_fts_insert",
+    "DROP TRIGGER sentences_fts_delete",
+    "DROP TRIGGER sentences_fts_update",
+    "DROP TABLE sentences_fts",
+]
+
+POSTGRES_UPGRADE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ix_sentences_text_trgm ON sentences USING gin (text gin_trgm_ops)",
+]
+
+POSTGRES_DOWNGRADE = ["DROP INDEX ix_sentences_text_trgm"]
+
+
+def _execute_all(statements: list[str]) -> None:
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _execute_all(SQLITE_UPGRADE)
+    elif dialect == "postgresql":
+        _execute_all(POSTGRES_UPGRADE)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _execute_all(SQLITE_DOWNGRADE)
+    elif dialect == "postgresql":
+        _execute_all(POSTGRES_DOWNGRADE)
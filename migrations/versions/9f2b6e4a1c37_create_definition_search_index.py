@@ -0,0 +1,106 @@
+"""create definition search index
+
+Revision ID: 9f2b6e4a1c37
+Revises: 7a3d5c9e2b81
+Create Date: 2026-10-18 18:02:44.671530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f2b6e4a1c37'
+down_revision: Union[str, None] = '7a3d5c9e2b81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the definitions were inserted in order, so their ids give their positions
+SQLITE_POSITIONS = """
+UPDATE definitions SET position = (
+    SELECT count(*) FROM definitions AS earlier
+    WHERE earlier.entry_id = definitions.entry_id AND earlier.id < definitions.id
+)
+"""
+
+POSTGRES_POSITIONS = """
+UPDATE definitions SET position = numbered.position FROM (
+    SELECT id, row_number() OVER (PARTITION BY entry_id ORDER BY id) - 1 AS position
+    FROM definitions
+) AS numbered
+WHERE definitions.id = numbered.id
+"""
+
+# FTS5 table with the porter stemmer on SQLite, english tsvector GIN index on Postgres
+SQLITE_UPGRADE = [
+    """
+    CREATE VIRTUAL TABLE definitions_fts
+    USING fts5(
+        definition, content='definitions', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER definitions_fts_insert AFTER INSERT ON definitions BEGIN
+        INSERT INTO definitions_fts(rowid, definition) VALUES (new.id, new.definition);
+    END
+    """,
+    """
+    CREATE TRIGGER definitions_fts_delete AFTER DELETE ON definitions BEGIN
+        INSERT INTO definitions_fts(definitions_fts, rowid, definition)
+        VALUES ('delete', old.id, old.definition);
+    END
+    """,
+    """
+    CREATE TRIGGER definitions_fts_update AFTER UPDATE ON definitions BEGIN
+        INSERT INTO definitions_fts(definitions_fts, rowid, definition)
+        VALUES ('delete', old.id, old.definition);
+        INSERT INTO definitions_fts(rowid, definition) VALUES (new.id, new.definition);
+    END
+    """,
+    "INSERT INTO definitions_fts(definitions_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER definitions_fts_insert",
+    "DROP TRIGGER definitions_fts_delete",
+    "DROP TRIGGER definitions_fts_update",
+    "DROP TABLE definitions_fts",
+]
+
+POSTGRES_UPGRADE = [
+    """
+    CREATE INDEX ix_definitions_definition_tsv
+    ON definitions USING gin (to_tsvector('english', definition))
+    """,
+]
+
+POSTGRES_DOWNGRADE = ["DROP INDEX ix_definitions_definition_tsv"]
+
+
+def _execute_all(statements: list[str]) -> None:
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    op.add_column('definitions', sa.Column('position', sa.Integer(), nullable=True))
+
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute(SQLITE_POSITIONS)
+        _execute_all(SQLITE_UPGRADE)
+    elif dialect == "postgresql":
+        op.execute(POSTGRES_POSITIONS)
+        _execute_all(POSTGRES_UPGRADE)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _execute_all(SQLITE_DOWNGRADE)
+    elif dialect == "postgresql":
+        _execute_all(POSTGRES_DOWNGRADE)
+
+    op.drop_column('definitions', 'position')
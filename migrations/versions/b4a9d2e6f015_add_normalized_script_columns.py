@@ -0,0 +1,170 @@
+"""add normalized script columns
+
+Revision ID: b4a9d2e6f015
+Revises: 2d7f6e1c3a58
+Create Date: 2026-10-18 13:40:08.715265
+
+"""
+import collections
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4a9d2e6f015'
+down_revision: Union[str, None] = '2d7f6e1c3a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The new columns are filled here the same way as backend.app.normalization (which
+# can be rerun later, e.g., after the dictionary changes): a traditional character
+# maps to the simplified character it corresponds to most often in the dictionary.
+
+entries = sa.table(
+    "entries",
+    sa.column("id", sa.Integer),
+    sa.column("simplified", sa.String),
+    sa.column("traditional", sa.String),
+    sa.column("normalized", sa.String),
+)
+sentences = sa.table(
+    "sentences",
+    sa.column("id", sa.Integer),
+    sa.column("text", sa.String),
+    sa.column("text_normalized", sa.String),
+)
+character_mappings = sa.table(
+    "character_mappings",
+    sa.column("traditional", sa.String),
+    sa.column("simplified", sa.String),
+)
+
+SQLITE_DROP_INDEX = [
+    "DROP TRIGGER sentences_fts_insert",
+    "DROP TRIGGER sentences_fts_delete",
+    "DROP TRIGGER sentences_fts_update",
+    "DROP TABLE sentences_fts",
+]
+
+
+def _sqlite_create_index(column: str) -> list[str]:
+    return [
+        f"""
+        CREATE VIRTUAL TABLE sentences_fts
+        USING fts5({column}, content='sentences', content_rowid='id', tokenize='trigram')
+        """,
+        f"""
+        CREATE TRIGGER sentences_fts_insert AFTER INSERT ON sentences BEGIN
+            INSERT INTO sentences_fts(rowid, {column}) VALUES (new.id, new.{column});
+        END
+        """,
+        f"""
+        CREATE TRIGGER sentences_fts_delete AFTER DELETE ON sentences BEGIN
+            INSERT INTO sentences_fts(sentences_fts, rowid, {column})
+            VALUES ('delete', old.id, old.{column});
+        END
+        """,
+        f"""
+        CREATE TRIGGER sentences_fts_update AFTER UPDATE ON sentences BEGIN
+            INSERT INTO sentences_fts(sentences_fts, rowid, {column})
+            VALUES ('delete', old.id, old.{column});
+            INSERT INTO sentences_fts(rowid, {column}) VALUES (new.id, new.{column});
+        END
+        """,
+        "INSERT INTO sentences_fts(sentences_fts) VALUES ('rebuild')",
+    ]
+
+
+def _execute_all(statements: list[str]) -> None:
+    for statement in statements:
+        op.execute(statement)
+
+
+def _build_character_map(pairs) -> dict[str, str]:
+    counts = collections.defaultdict(collections.Counter)
+    for traditional, simplified in pairs:
+        if not traditional or not simplified or len(traditional) != len(simplified):
+            continue
+        for t, s in zip(traditional, simplified):
+            if t != s:
+                counts[t][s] += 1
+    return {
+        t: min(candidates, key=lambda s: (-candidates[s], s))
+        for t, candidates in counts.items()
+    }
+
+
+def _normalize_column(connection, table, text_column: str, normalized_column: str, script):
+    rows = connection.execute(sa.select(table.c.id, table.c[text_column])).all()
+    if not rows:
+        return
+    connection.execute(
+        table.update()
+        .where(table.c.id == sa.bindparam("row_id"))
+        .values({normalized_column: sa.bindparam("normalized")}),
+        [{"row_id": row_id, "normalized": (text or "").translate(script)} for row_id, text in rows],
+    )
+
+
+def _backfill_normalized() -> None:
+    connection = op.get_bind()
+    pairs = connection.execute(sa.select(entries.c.traditional, entries.c.simplified)).all()
+    char_map = _build_character_map(pairs)
+    if char_map:
+        op.bulk_insert(
+            character_mappings,
+            [{"traditional": t, "simplified": s} for t, s in sorted(char_map.items())],
+        )
+
+    script = str.maketrans(char_map)
+    _normalize_column(connection, entries, "simplified", "normalized", script)
+    _normalize_column(connection, sentences, "text", "text_normalized", script)
+
+
+def upgrade() -> None:
+    op.create_table('character_mappings',
+    sa.Column('traditional', sa.String(), nullable=False),
+    sa.Column('simplified', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('traditional')
+    )
+    op.add_column('sentences', sa.Column('text_normalized', sa.String(), nullable=True))
+    op.add_column('entries', sa.Column('normalized', sa.String(), nullable=True))
+    op.create_index(op.f('ix_entries_normalized'), 'entries', ['normalized'], unique=False)
+
+    # search the normalized text instead, indexing it once it's filled
+    # (rather than updating the old index for every sentence)
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _execute_all(SQLITE_DROP_INDEX)
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX ix_sentences_text_trgm")
+
+    _backfill_normalized()
+
+    if dialect == "sqlite":
+        _execute_all(_sqlite_create_index("text_normalized"))
+    elif dialect == "postgresql":
+        op.execute(
+            "CREATE INDEX ix_sentences_text_normalized_trgm "
+            "ON sentences USING gin (text_normalized gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _execute_all(SQLITE_DROP_INDEX)
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX ix_sentences_text_normalized_trgm")
+
+    op.drop_index(op.f('ix_entries_normalized'), table_name='entries')
+    op.drop_column('entries', 'normalized')
+    op.drop_column('sentences', 'text_normalized')
+    op.drop_table('character_mappings')
+
+    if dialect == "sqlite":
+        _execute_all(_sqlite_create_index("text"))
+    elif dialect == "postgresql":
+        op.execute("CREATE INDEX ix_sentences_text_trgm ON sentences USING gin (text gin_trgm_ops)")
@@ -0,0 +1,44 @@
+"""add sentence metrics
+
+Revision ID: e2c85f4d1b69
+Revises: b4a9d2e6f015
+Create Date: 2026-10-18 14:52:36.104587
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c85f4d1b69'
+down_revision: Union[str, None] = 'b4a9d2e6f015'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The new columns are filled by python -m backend.app.sentence_metrics (or the loader).
+
+
+def upgrade() -> None:
+    op.add_column('sentences', sa.Column('token_count', sa.Integer(), nullable=True))
+    op.add_column('sentences', sa.Column('max_hsk_level', sa.Integer(), nullable=True))
+    op.add_column('sentences', sa.Column('unknown_ratio', sa.Float(), nullable=True))
+    op.add_column('sentences', sa.Column('difficulty', sa.Float(), nullable=True))
+    op.create_index(op.f('ix_sentences_token_count'), 'sentences', ['token_count'], unique=False)
+    op.create_index(op.f('ix_sentences_max_hsk_level'), 'sentences', ['max_hsk_level'], unique=False)
+    op.create_index(op.f('ix_sentences_unknown_ratio'), 'sentences', ['unknown_ratio'], unique=False)
+    op.create_index(op.f('ix_sentences_difficulty'), 'sentences', ['difficulty'], unique=False)
+    op.create_index('ix_sentences_max_hsk_level_difficulty', 'sentences', ['max_hsk_level', 'difficulty'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sentences_max_hsk_level_difficulty', table_name='sentences')
+    op.drop_index(op.f('ix_sentences_difficulty'), table_name='sentences')
+    op.drop_index(op.f('ix_sentences_unknown_ratio'), table_name='sentences')
+    op.drop_index(op.f('ix_sentences_max_hsk_level'), table_name='sentences')
+    op.drop_index(op.f('ix_sentences_token_count'), table_name='sentences')
+    op.drop_column('sentences', 'difficulty')
+    op.drop_column('sentences', 'unknown_ratio')
+    op.drop_column('sentences', 'max_hsk_level')
+    op.drop_column('sentences', 'token_count')